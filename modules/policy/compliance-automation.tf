@@ -25,6 +25,8 @@ resource "google_cloudfunctions_function" "auto_remediation" {
     PROJECT_ID           = var.project_id
     REMEDIATION_ENABLED  = var.policy_violation_actions.auto_remediate
     NOTIFICATION_TOPIC   = google_pubsub_topic.compliance_notifications.name
+    IDEMPOTENCY_BACKEND  = "gcs"
+    IDEMPOTENCY_BUCKET   = google_storage_bucket.policy_artifacts.name
   }
 
   service_account_email = google_service_account.policy_enforcer.email
@@ -123,6 +125,111 @@ resource "google_bigquery_table" "policy_violations" {
       name = "remediation_timestamp"
       type = "TIMESTAMP"
       mode = "NULLABLE"
+    },
+    {
+      name = "remediation_error"
+      type = "STRING"
+      mode = "NULLABLE"
+    },
+    {
+      name = "workspace"
+      type = "STRING"
+      mode = "NULLABLE"
+    },
+    {
+      name = "violation_id"
+      type = "STRING"
+      mode = "NULLABLE"
+    },
+    {
+      name = "rule_id"
+      type = "STRING"
+      mode = "NULLABLE"
+    },
+    {
+      name = "resource_address"
+      type = "STRING"
+      mode = "NULLABLE"
+    }
+  ])
+
+  # Remediation status updates match rows by violation_id
+  clustering = ["violation_id"]
+
+  labels = var.labels
+}
+
+# BigQuery table for per-rule policy evaluation profiles (POLICY_PROFILE=true)
+resource "google_bigquery_table" "policy_rule_profile" {
+  dataset_id = google_bigquery_dataset.compliance_data.dataset_id
+  table_id   = "policy_rule_profile"
+  project    = var.project_id
+
+  time_partitioning {
+    type  = "DAY"
+    field = "timestamp"
+  }
+
+  schema = jsonencode([
+    {
+      name = "timestamp"
+      type = "TIMESTAMP"
+      mode = "REQUIRED"
+    },
+    {
+      name = "bundle_generation"
+      type = "STRING"
+      mode = "NULLABLE"
+    },
+    {
+      name = "scope"
+      type = "STRING"
+      mode = "REQUIRED"
+    },
+    {
+      name = "package"
+      type = "STRING"
+      mode = "NULLABLE"
+    },
+    {
+      name = "rule"
+      type = "STRING"
+      mode = "NULLABLE"
+    },
+    {
+      name = "file"
+      type = "STRING"
+      mode = "NULLABLE"
+    },
+    {
+      name = "line"
+      type = "INTEGER"
+      mode = "NULLABLE"
+    },
+    {
+      name = "description"
+      type = "STRING"
+      mode = "NULLABLE"
+    },
+    {
+      name = "total_time_ms"
+      type = "FLOAT"
+      mode = "REQUIRED"
+    },
+    {
+      name = "evaluations"
+      type = "INTEGER"
+      mode = "NULLABLE"
+    },
+    {
+      name = "expression_evaluations"
+      type = "INTEGER"
+      mode = "NULLABLE"
+    },
+    {
+      name = "redos"
+      type = "INTEGER"
+      mode = "NULLABLE"
     }
   ])
 
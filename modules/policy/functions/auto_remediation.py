@@ -6,14 +6,19 @@ Automatically remediates common policy violations
 import json
 import os
 import base64
-from google.cloud import compute_v1
-from google.cloud import storage
-from google.cloud import sql_v1
-from google.cloud import pubsub_v1
+import time
 from google.cloud import bigquery
 import logging
 from datetime import datetime
 
+from clients import get_client
+from idempotency import get_ledger
+from notification_publisher import get_publisher
+from operation_tracker import operation_tracker_from_env
+from remediation_executor import get_remediation_executor
+from resource_locations import get_location_index
+from violation_parser import normalize_violation, parse_violation, violation_resource_name
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -29,40 +34,256 @@ def remediate_violations(event, context):
         
         logger.info(f"Processing auto-remediation for: {message_data}")
         
-        violations = message_data.get('violations', [])
+        violations = [normalize_violation(violation) for violation in message_data.get('violations', [])]
         if not violations:
             logger.info("No violations to remediate")
             return
         
-        remediation_results = []
-        
-        for violation in violations:
-            try:
-                result = remediate_single_violation(violation, message_data)
-                remediation_results.append(result)
-            except Exception as e:
-                logger.error(f"Failed to remediate violation {violation}: {str(e)}")
-                remediation_results.append({
-                    'violation': violation,
-                    'status': 'failed',
-                    'error': str(e)
-                })
+        def remediation_failed(group, error):
+            logger.error(f"Failed to remediate violations {[violation for _, violation in group]}: {str(error)}")
+            results = [
+                {'violation': violation, 'status': 'failed', 'error': str(error)}
+                for _, violation in group
+            ]
+            return results, sum(remediation_api_calls(violation) for _, violation in group)
+        
+        # Resources this message already remediated on an earlier delivery keep their recorded results
+        message_id = getattr(context, 'event_id', None)
+        ledger = get_ledger()
+        groups = group_violations_by_resource(violations)
+        recorded = {}
+        for index, group in enumerate(groups):
+            outcome = ledger.lookup(message_id, *resource_fingerprint(group))
+            if outcome is not None and len(outcome) == len(group):
+                recorded[index] = outcome
+        if len(recorded) == len(groups):
+            logger.info(f"Message {message_id} was already remediated, skipping redelivery")
+            return
+        pending_groups = [group for index, group in enumerate(groups) if index not in recorded]
+        
+        # Remediate each resource once, concurrently within per-API rate limits
+        started = time.monotonic()
+        executor = get_remediation_executor()
+        tracker = operation_tracker_from_env()
+        group_outcomes = executor.run(
+            pending_groups,
+            lambda group: remediate_resource(group, message_data, tracker),
+            route=resource_route,
+            on_failure=remediation_failed
+        )
+        
+        # Put results back in the order of the violations
+        remediation_results = [None] * len(violations)
+        api_calls = 0
+        for group, (results, group_api_calls) in zip(pending_groups, group_outcomes):
+            api_calls += group_api_calls
+            for (position, _), result in zip(group, results):
+                remediation_results[position] = result
+        for index, results in recorded.items():
+            for (position, _), result in zip(groups[index], results):
+                remediation_results[position] = result
+        
+        pending_violations = [violation for group in pending_groups for _, violation in group]
+        api_calls_saved = sum(remediation_api_calls(violation) for violation in pending_violations) - api_calls
+        logger.info(
+            f"Remediated {len(pending_violations)} violations on {len(pending_groups)} resources "
+            f"with {api_calls} API calls ({api_calls_saved} saved by coalescing, "
+            f"{len(recorded)} resources already remediated)"
+        )
+        
+        # Settle results whose operations were started above, within the remediation budget
+        tracker.wait(deadline=started + executor.budget_seconds)
+        
+        # IDs of the policy_violations rows, in the same order as the violations
+        violation_ids = message_data.get('violation_ids') or []
+        for position, result in enumerate(remediation_results):
+            result['violation_id'] = violation_ids[position] if position < len(violation_ids) else None
         
         # Update remediation status in BigQuery
         update_remediation_status(remediation_results)
         
         # Send notification about remediation results
-        send_remediation_notification(remediation_results, message_data)
+        send_remediation_notification(remediation_results, message_data, api_calls_saved)
+        
+        # Record settled resources so a redelivery of this message skips them
+        for group, (results, _) in zip(pending_groups, group_outcomes):
+            if all(result['status'] in SETTLED_STATUSES for result in results):
+                ledger.record(message_id, *resource_fingerprint(group), results)
         
     except Exception as e:
         logger.error(f"Error in auto-remediation: {str(e)}")
+    finally:
+        get_publisher().flush()
+
+def group_violations_by_resource(violations):
+    """
+    Group (position, violation) pairs by the resource they name, in order of
+    first appearance; violations without a resource address stay on their own
+    """
+    groups = {}
+    for position, violation in enumerate(violations):
+        resource_info = extract_resource_info(violation)
+        if resource_info['type'] == 'unknown':
+            key = ('unknown', position)
+        else:
+            key = (resource_info['type'], resource_info['name'])
+        groups.setdefault(key, []).append((position, violation))
+    return list(groups.values())
+
+def resource_fingerprint(group):
+    """
+    Return the (resource, action) a resource group is recorded under in the idempotency ledger
+    """
+    resource_info = extract_resource_info(group[0][1])
+    if resource_info['type'] == 'unknown':
+        resource = group[0][1]['msg']
+    else:
+        resource = f"{resource_info['type']}.{resource_info['name']}"
+    return resource, '+'.join(sorted({classify_violation(violation) for _, violation in group}))
+
+def resource_route(group):
+    """
+    Return the ({service: API calls}, remediation types) a resource group is
+    rate limited and timed under
+
+    Every remediation type in the group is charged to its own service at the
+    REMEDIATION_API_CALLS estimate; repeats of a type share one remediation
+    and are not charged again. Types with no remediation make no calls.
+    """
+    charges = {}
+    violation_types = {}
+    for _, violation in group:
+        violation_types.setdefault(classify_violation(violation), violation)
+    for violation in violation_types.values():
+        service, _ = remediation_route(violation)
+        if service is not None:
+            charges[service] = charges.get(service, 0) + remediation_api_calls(violation)
+    return charges, '+'.join(sorted(violation_types))
+
+def remediate_resource(group, message_data, tracker=None):
+    """
+    Remediate every violation of one resource, fetching it once and merging
+    fixes where the API allows
+
+    Returns the results in group order and the number of API calls made.
+    Operations the fixes start are registered with tracker, if given.
+    """
+    resource_info = locate_resource(extract_resource_info(group[0][1]))
+    typed = [(violation, classify_violation(violation)) for _, violation in group]
+    results = [None] * len(typed)
+    api_calls = 0
+    
+    # Label and public IP fixes on an instance share one get
+    if resource_info['type'] == 'google_compute_instance':
+        instance_positions = [
+            position for position, (_, violation_type) in enumerate(typed)
+            if violation_type in INSTANCE_REMEDIATIONS
+        ]
+        if instance_positions:
+            instance_results, api_calls = remediate_instance(
+                resource_info, [typed[position] for position in instance_positions], tracker
+            )
+            for position, result in zip(instance_positions, instance_results):
+                results[position] = result
+    
+    # Other fixes run once per violation type; repeated violations share the result
+    remediated = {}
+    for position, (violation, violation_type) in enumerate(typed):
+        if results[position] is not None:
+            continue
+        if violation_type in remediated:
+            results[position] = dict(remediated[violation_type], violation=violation, coalesced=True)
+            if tracker is not None:
+                tracker.share(remediated[violation_type], results[position])
+            continue
+        remediated[violation_type] = remediate_single_violation(violation, message_data, tracker)
+        results[position] = remediated[violation_type]
+        api_calls += remediation_api_calls(violation)
+    
+    return results, api_calls
 
-def remediate_single_violation(violation, message_data):
+def remediate_instance(resource_info, entries, tracker=None):
+    """
+    Apply all label and public IP fixes for one compute instance
+
+    The instance is read once; every label fix is merged into a single
+    set_labels call with that read's fingerprint, and every access config is
+    removed in the same pass. Returns one result per (violation, type) entry
+    and the number of API calls made; a result is settled by tracker once all
+    operations for its type finish.
+    """
+    resource_name = resource_info.get('name')
+    resource = f"google_compute_instance.{resource_name}"
+    project_id = os.environ.get('PROJECT_ID')
+    coalesced = len(entries) > 1
+    api_calls = 0
+    
+    def result_for(violation, status, **details):
+        return {'violation': violation, 'status': status, 'resource': resource, 'coalesced': coalesced, **details}
+    
+    try:
+        zone = resource_zone(resource_info)
+        client = get_client('compute.instances')
+        instance = client.get(project=project_id, zone=zone, instance=resource_name)
+        api_calls += 1
+        violation_types = {violation_type for _, violation_type in entries}
+        actions = {}
+        operations = {}
+        
+        if 'missing_labels' in violation_types:
+            updated_labels = {**(instance.labels or {}), **REQUIRED_LABELS}
+            operations['missing_labels'] = [client.set_labels(
+                project=project_id,
+                zone=zone,
+                instance=resource_name,
+                instances_set_labels_request_resource={
+                    'labels': updated_labels,
+                    'label_fingerprint': instance.label_fingerprint
+                }
+            )]
+            api_calls += 1
+            actions['missing_labels'] = ('remediated', 'added_required_labels')
+        
+        if 'public_ip' in violation_types:
+            operations['public_ip'] = []
+            for interface in instance.network_interfaces:
+                for access_config in interface.access_configs:
+                    operations['public_ip'].append(client.delete_access_config(
+                        project=project_id,
+                        zone=zone,
+                        instance=resource_name,
+                        access_config=access_config.name,
+                        network_interface=interface.name
+                    ))
+                    api_calls += 1
+            actions['public_ip'] = ('remediated', 'removed_public_ip') if operations['public_ip'] else ('no_action_needed', None)
+        
+        results = []
+        results_by_type = {}
+        for violation, violation_type in entries:
+            status, action = actions[violation_type]
+            if action:
+                results.append(result_for(violation, status, action=action))
+            else:
+                results.append(result_for(violation, status, message='No public IP found'))
+            results_by_type.setdefault(violation_type, []).append(results[-1])
+        
+        if tracker is not None:
+            for violation_type, type_operations in operations.items():
+                for operation in type_operations:
+                    tracker.track(operation, results_by_type[violation_type])
+        return results, api_calls
+        
+    except Exception as e:
+        logger.error(f"Failed to remediate instance {resource_name}: {str(e)}")
+        return [result_for(violation, 'failed', error=str(e)) for violation, _ in entries], api_calls
+
+def remediate_single_violation(violation, message_data, tracker=None):
     """
     Remediate a single policy violation
     """
     violation_type = classify_violation(violation)
-    resource_info = extract_resource_info(violation)
+    resource_info = locate_resource(extract_resource_info(violation))
     
     logger.info(f"Remediating {violation_type} for resource {resource_info}")
     
@@ -76,7 +297,7 @@ def remediate_single_violation(violation, message_data):
     }
     
     if violation_type in remediation_functions:
-        return remediation_functions[violation_type](resource_info, violation)
+        return remediation_functions[violation_type](resource_info, violation, tracker)
     else:
         logger.warning(f"No remediation available for violation type: {violation_type}")
         return {
@@ -85,7 +306,65 @@ def remediate_single_violation(violation, message_data):
             'message': f"No automatic remediation for {violation_type}"
         }
 
-def remediate_missing_labels(resource_info, violation):
+# Result statuses that need no retry; only resources whose results all have one are recorded
+SETTLED_STATUSES = ('remediated', 'no_action_needed', 'no_remediation_available')
+
+REQUIRED_LABELS = {
+    'security_classification': 'internal',
+    'environment': 'dev',
+    'cost_center': 'engineering',
+    'owner': 'platform-team'
+}
+
+# Remediations applied together by remediate_instance
+INSTANCE_REMEDIATIONS = ('missing_labels', 'public_ip')
+
+# API calls one remediation makes on its own, to report the calls saved by coalescing
+REMEDIATION_API_CALLS = {
+    'missing_labels': 2,
+    'public_ip': 2,
+    'unencrypted_storage': 1,
+    'open_firewall': 2,
+    'sql_public_ip': 2,
+    'missing_backup': 2
+}
+
+def remediation_api_calls(violation):
+    """Return the API calls remediating violation alone would make"""
+    violation_type = classify_violation(violation)
+    if violation_type == 'missing_labels' and extract_resource_info(violation).get('type') == 'google_storage_bucket':
+        return 1
+    return REMEDIATION_API_CALLS.get(violation_type, 0)
+
+# API each remediation calls, used to pick its rate limit
+REMEDIATION_SERVICES = {
+    'public_ip': 'compute',
+    'open_firewall': 'compute',
+    'unencrypted_storage': 'storage',
+    'sql_public_ip': 'sql',
+    'missing_backup': 'sql'
+}
+
+def remediation_route(violation):
+    """
+    Return the (service, remediation type) a violation is rate limited and timed under
+    """
+    violation_type = classify_violation(violation)
+    if violation_type == 'missing_labels':
+        resource_type = extract_resource_info(violation).get('type')
+        return ('storage' if resource_type == 'google_storage_bucket' else 'compute'), violation_type
+    return REMEDIATION_SERVICES.get(violation_type), violation_type
+
+def track_operation(tracker, operation, result, kind='compute', project=None):
+    """
+    Register the operation a remediation started with tracker, if any, and
+    return its result; without a tracker the result is reported as started
+    """
+    if tracker is not None:
+        tracker.track(operation, result, kind=kind, project=project)
+    return result
+
+def remediate_missing_labels(resource_info, violation, tracker=None):
     """
     Add missing required labels to resources
     """
@@ -94,16 +373,11 @@ def remediate_missing_labels(resource_info, violation):
         resource_name = resource_info.get('name')
         project_id = os.environ.get('PROJECT_ID')
         
-        required_labels = {
-            'security_classification': 'internal',
-            'environment': 'dev',
-            'cost_center': 'engineering',
-            'owner': 'platform-team'
-        }
+        required_labels = REQUIRED_LABELS
         
         if resource_type == 'google_compute_instance':
-            client = compute_v1.InstancesClient()
-            zone = resource_info.get('zone', 'us-central1-a')
+            client = get_client('compute.instances')
+            zone = resource_zone(resource_info)
             
             # Get current instance
             instance = client.get(project=project_id, zone=zone, instance=resource_name)
@@ -113,7 +387,7 @@ def remediate_missing_labels(resource_info, violation):
             updated_labels = {**current_labels, **required_labels}
             
             # Apply labels
-            client.set_labels(
+            operation = client.set_labels(
                 project=project_id,
                 zone=zone,
                 instance=resource_name,
@@ -123,15 +397,15 @@ def remediate_missing_labels(resource_info, violation):
                 }
             )
             
-            return {
+            return track_operation(tracker, operation, {
                 'violation': violation,
                 'status': 'remediated',
                 'action': 'added_required_labels',
                 'resource': f"{resource_type}.{resource_name}"
-            }
+            })
             
         elif resource_type == 'google_storage_bucket':
-            client = storage.Client()
+            client = get_client('storage')
             bucket = client.bucket(resource_name)
             
             # Update bucket labels
@@ -147,6 +421,12 @@ def remediate_missing_labels(resource_info, violation):
                 'resource': f"{resource_type}.{resource_name}"
             }
         
+        return {
+            'violation': violation,
+            'status': 'no_remediation_available',
+            'message': f"No automatic label remediation for {resource_type}"
+        }
+        
     except Exception as e:
         logger.error(f"Failed to remediate missing labels: {str(e)}")
         return {
@@ -155,16 +435,16 @@ def remediate_missing_labels(resource_info, violation):
             'error': str(e)
         }
 
-def remediate_public_ip(resource_info, violation):
+def remediate_public_ip(resource_info, violation, tracker=None):
     """
     Remove public IP from compute instances in production
     """
     try:
         resource_name = resource_info.get('name')
         project_id = os.environ.get('PROJECT_ID')
-        zone = resource_info.get('zone', 'us-central1-a')
+        zone = resource_zone(resource_info)
         
-        client = compute_v1.InstancesClient()
+        client = get_client('compute.instances')
         
         # Get instance details
         instance = client.get(project=project_id, zone=zone, instance=resource_name)
@@ -173,7 +453,7 @@ def remediate_public_ip(resource_info, violation):
         for interface in instance.network_interfaces:
             if interface.access_configs:
                 # Remove access config (public IP)
-                client.delete_access_config(
+                operation = client.delete_access_config(
                     project=project_id,
                     zone=zone,
                     instance=resource_name,
@@ -181,12 +461,12 @@ def remediate_public_ip(resource_info, violation):
                     network_interface=interface.name
                 )
                 
-                return {
+                return track_operation(tracker, operation, {
                     'violation': violation,
                     'status': 'remediated',
                     'action': 'removed_public_ip',
                     'resource': f"google_compute_instance.{resource_name}"
-                }
+                })
         
         return {
             'violation': violation,
@@ -202,7 +482,7 @@ def remediate_public_ip(resource_info, violation):
             'error': str(e)
         }
 
-def remediate_open_firewall(resource_info, violation):
+def remediate_open_firewall(resource_info, violation, tracker=None):
     """
     Restrict overly permissive firewall rules
     """
@@ -210,7 +490,7 @@ def remediate_open_firewall(resource_info, violation):
         resource_name = resource_info.get('name')
         project_id = os.environ.get('PROJECT_ID')
         
-        client = compute_v1.FirewallsClient()
+        client = get_client('compute.firewalls')
         
         # Get firewall rule
         firewall = client.get(project=project_id, firewall=resource_name)
@@ -223,18 +503,18 @@ def remediate_open_firewall(resource_info, violation):
             # Update firewall rule
             firewall.source_ranges = restricted_ranges
             
-            client.update(
+            operation = client.update(
                 project=project_id,
                 firewall=resource_name,
                 firewall_resource=firewall
             )
             
-            return {
+            return track_operation(tracker, operation, {
                 'violation': violation,
                 'status': 'remediated',
                 'action': 'restricted_source_ranges',
                 'resource': f"google_compute_firewall.{resource_name}"
-            }
+            })
         
         return {
             'violation': violation,
@@ -250,7 +530,7 @@ def remediate_open_firewall(resource_info, violation):
             'error': str(e)
         }
 
-def remediate_sql_public_ip(resource_info, violation):
+def remediate_sql_public_ip(resource_info, violation, tracker=None):
     """
     Disable public IP for Cloud SQL instances
     """
@@ -258,7 +538,7 @@ def remediate_sql_public_ip(resource_info, violation):
         resource_name = resource_info.get('name')
         project_id = os.environ.get('PROJECT_ID')
         
-        client = sql_v1.SqlInstancesServiceClient()
+        client = get_client('sql.instances')
         
         # Get instance
         instance = client.get(project=project_id, instance=resource_name)
@@ -274,12 +554,12 @@ def remediate_sql_public_ip(resource_info, violation):
                 body=instance
             )
             
-            return {
+            return track_operation(tracker, operation, {
                 'violation': violation,
                 'status': 'remediated',
                 'action': 'disabled_public_ip',
                 'resource': f"google_sql_database_instance.{resource_name}"
-            }
+            }, kind='sql', project=project_id)
         
         return {
             'violation': violation,
@@ -295,7 +575,7 @@ def remediate_sql_public_ip(resource_info, violation):
             'error': str(e)
         }
 
-def remediate_unencrypted_storage(resource_info, violation):
+def remediate_unencrypted_storage(resource_info, violation, tracker=None):
     """
     Enable encryption for storage buckets
     """
@@ -303,7 +583,7 @@ def remediate_unencrypted_storage(resource_info, violation):
         resource_name = resource_info.get('name')
         project_id = os.environ.get('PROJECT_ID')
         
-        client = storage.Client()
+        client = get_client('storage')
         bucket = client.bucket(resource_name)
         
         # Set default KMS key (this would need to be configured)
@@ -328,7 +608,7 @@ def remediate_unencrypted_storage(resource_info, violation):
             'error': str(e)
         }
 
-def remediate_missing_backup(resource_info, violation):
+def remediate_missing_backup(resource_info, violation, tracker=None):
     """
     Enable backup for Cloud SQL instances
     """
@@ -336,7 +616,7 @@ def remediate_missing_backup(resource_info, violation):
         resource_name = resource_info.get('name')
         project_id = os.environ.get('PROJECT_ID')
         
-        client = sql_v1.SqlInstancesServiceClient()
+        client = get_client('sql.instances')
         
         # Get instance
         instance = client.get(project=project_id, instance=resource_name)
@@ -353,12 +633,12 @@ def remediate_missing_backup(resource_info, violation):
                 body=instance
             )
             
-            return {
+            return track_operation(tracker, operation, {
                 'violation': violation,
                 'status': 'remediated',
                 'action': 'enabled_backup',
                 'resource': f"google_sql_database_instance.{resource_name}"
-            }
+            }, kind='sql', project=project_id)
         
         return {
             'violation': violation,
@@ -374,96 +654,163 @@ def remediate_missing_backup(resource_info, violation):
             'error': str(e)
         }
 
+# Remediation for each policy rule that has one; rules not listed are reported, not fixed
+RULE_REMEDIATIONS = {
+    'security.instance_environment_label': 'missing_labels',
+    'security.bucket_encryption': 'unencrypted_storage',
+    'security.instance_public_ip': 'public_ip',
+    'security.firewall_open_ingress': 'open_firewall',
+    'security.sql_backup': 'missing_backup',
+    'compliance.cis_2_2_sql_public_ip': 'sql_public_ip',
+    'security.enhanced.security_classification_label': 'missing_labels',
+    'security.enhanced.bucket_cmek': 'unencrypted_storage',
+    'cost.governance.cost_center_label': 'missing_labels'
+}
+
 def classify_violation(violation):
     """
-    Classify the type of violation for appropriate remediation
+    Classify the type of violation for appropriate remediation, by rule_id
+    or, for legacy message strings, by the keywords in the message
     """
-    violation_lower = violation.lower()
-    
-    if 'label' in violation_lower:
-        return 'missing_labels'
-    elif 'public ip' in violation_lower and 'production' in violation_lower:
-        return 'public_ip'
-    elif 'encryption' in violation_lower and 'bucket' in violation_lower:
-        return 'unencrypted_storage'
-    elif 'firewall' in violation_lower and '0.0.0.0/0' in violation_lower:
-        return 'open_firewall'
-    elif 'sql' in violation_lower and 'public ip' in violation_lower:
-        return 'sql_public_ip'
-    elif 'backup' in violation_lower:
-        return 'missing_backup'
-    else:
-        return 'unknown'
+    if violation['rule_id']:
+        return RULE_REMEDIATIONS.get(violation['rule_id'], 'unknown')
+    return parse_violation(violation['msg'])['violation_type']
 
 def extract_resource_info(violation):
     """
-    Extract resource information from violation message
+    Extract resource type and name from a violation's address
     """
-    import re
-    
-    # Extract resource type and name
-    resource_match = re.search(r'(google_\w+)\.(\w+)', violation)
-    if resource_match:
-        return {
-            'type': resource_match.group(1),
-            'name': resource_match.group(2)
-        }
-    
-    return {'type': 'unknown', 'name': 'unknown'}
+    return {'type': violation['type'], 'name': violation_resource_name(violation)}
+
+def locate_resource(resource_info):
+    """
+    Add the zone or region and self link of a resource from the location index,
+    for resource types the index covers
+    """
+    location = get_location_index(os.environ.get('PROJECT_ID')).lookup(
+        resource_info.get('type'), resource_info.get('name')
+    )
+    if not location:
+        return resource_info
+    return {**resource_info, **{key: value for key, value in location.items() if value}}
+
+def resource_zone(resource_info):
+    """Return the zone of a located resource, failing instead of guessing one"""
+    zone = resource_info.get('zone')
+    if not zone:
+        raise ValueError(f"Zone of {resource_info.get('type')}.{resource_info.get('name')} is unknown")
+    return zone
+
+# Final states written to policy_violations; when one key has several results the first listed wins
+REMEDIATION_STATUS_PRIORITY = ('failed', 'timed_out', 'remediated', 'no_action_needed', 'no_remediation_available')
 
 def update_remediation_status(remediation_results):
     """
-    Update remediation status in BigQuery
+    Write the final state of every remediation result to BigQuery, with one
+    MERGE on violation_id and one on the message for notifications
+    published without IDs
     """
     try:
-        client = bigquery.Client()
-        project_id = os.environ.get('PROJECT_ID')
-        dataset_id = 'compliance_data'
-        table_id = 'policy_violations'
-        
+        # Each source holds distinct keys, so a target row matches at most one source row
+        by_id = {}
+        by_message = {}
         for result in remediation_results:
-            if result['status'] == 'remediated':
-                # Update the violation record
-                query = f"""
-                UPDATE `{project_id}.{dataset_id}.{table_id}`
-                SET remediation_status = 'remediated',
-                    remediation_timestamp = CURRENT_TIMESTAMP()
-                WHERE violation_message = @violation_message
-                """
-                
-                job_config = bigquery.QueryJobConfig(
-                    query_parameters=[
-                        bigquery.ScalarQueryParameter("violation_message", "STRING", result['violation'])
-                    ]
-                )
-                
-                client.query(query, job_config=job_config)
+            if result.get('violation_id'):
+                keep_first_status(by_id, result['violation_id'], result)
+            else:
+                keep_first_status(by_message, result['violation']['msg'], result)
+        if not by_id and not by_message:
+            logger.info("No remediation results to update")
+            return
         
-        logger.info(f"Updated remediation status for {len(remediation_results)} violations")
+        client = get_client('bigquery')
+        project_id = os.environ.get('PROJECT_ID')
+        table = f"`{project_id}.compliance_data.policy_violations`"
+        
+        # Matching on violation_id alone lets clustering prune the scan
+        if by_id:
+            merge_remediation_status(client, f"""
+            MERGE {table} AS target
+            USING (SELECT * FROM UNNEST(@rows)) AS source
+            ON target.violation_id = source.violation_id
+            WHEN MATCHED AND IFNULL(target.remediation_status, '') != 'remediated' THEN
+              UPDATE SET remediation_status = source.status,
+                         remediation_error = source.error,
+                         remediation_timestamp = CURRENT_TIMESTAMP()
+            """, 'violation_id', by_id, 'violation IDs')
+        
+        # Legacy notifications without IDs still match on the message
+        if by_message:
+            merge_remediation_status(client, f"""
+            MERGE {table} AS target
+            USING (SELECT * FROM UNNEST(@rows)) AS source
+            ON target.violation_message = source.violation_message
+            WHEN MATCHED AND IFNULL(target.remediation_status, '') != 'remediated' THEN
+              UPDATE SET remediation_status = source.status,
+                         remediation_error = source.error,
+                         remediation_timestamp = CURRENT_TIMESTAMP()
+            """, 'violation_message', by_message, 'violation messages')
         
     except Exception as e:
         logger.error(f"Failed to update remediation status: {str(e)}")
 
-def send_remediation_notification(remediation_results, message_data):
+def keep_first_status(results_by_key, key, result):
+    """Keep the result for key whose status comes first in REMEDIATION_STATUS_PRIORITY"""
+    def rank(status):
+        return REMEDIATION_STATUS_PRIORITY.index(status) if status in REMEDIATION_STATUS_PRIORITY else len(REMEDIATION_STATUS_PRIORITY)
+    current = results_by_key.get(key)
+    if current is None or rank(result['status']) < rank(current['status']):
+        results_by_key[key] = result
+
+def merge_remediation_status(client, query, key_field, results_by_key, description):
+    """
+    Run one remediation status MERGE over distinct keys and check its row count
+
+    The source is an array of (key_field, status, error) structs. A key can
+    match several rows (violation_id repeats on every re-evaluation of a
+    plan), but each key that still has an unremediated row updates at least
+    one, so fewer affected rows than keys means some keys matched nothing.
+    """
+    rows = [
+        bigquery.StructQueryParameter(
+            None,
+            bigquery.ScalarQueryParameter(key_field, 'STRING', key),
+            bigquery.ScalarQueryParameter('status', 'STRING', result['status']),
+            bigquery.ScalarQueryParameter('error', 'STRING', result.get('error'))
+        )
+        for key, result in sorted(results_by_key.items())
+    ]
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ArrayQueryParameter('rows', 'STRUCT', rows)]
+    )
+    job = client.query(query, job_config=job_config)
+    job.result()
+    
+    updated_rows = job.num_dml_affected_rows or 0
+    if updated_rows < len(rows):
+        logger.warning(
+            f"Remediation status MERGE updated {updated_rows} rows for {len(rows)} distinct {description}; "
+            f"at least {len(rows) - updated_rows} had no unremediated row"
+        )
+    logger.info(f"Updated remediation status for {len(rows)} {description} ({updated_rows} rows)")
+
+def send_remediation_notification(remediation_results, message_data, api_calls_saved=0):
     """
     Send notification about remediation results
     """
     try:
-        publisher = pubsub_v1.PublisherClient()
-        project_id = os.environ.get('PROJECT_ID')
         topic_name = 'compliance-notifications'
-        topic_path = publisher.topic_path(project_id, topic_name)
         
         notification = {
             'type': 'auto_remediation_complete',
             'results': remediation_results,
+            'api_calls_saved': api_calls_saved,
             'metadata': message_data,
             'timestamp': datetime.utcnow().isoformat()
         }
         
-        message_data_bytes = json.dumps(notification).encode('utf-8')
-        future = publisher.publish(topic_path, message_data_bytes)
-        logger.info(f"Published remediation notification: {future.result()}")
+        get_publisher().publish(topic_name, notification)
+        logger.info(f"Queued remediation notification on {topic_name}")
         
     except Exception as e:
         logger.error(f"Failed to send remediation notification: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+Policy Bundle Cache
+Keeps extracted OPA policy bundles on warm instances, keyed by the Cloud Storage
+object generation, so unchanged bundles are not downloaded and extracted again
+"""
+
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class BundleCache:
+    """
+    Warm-instance cache of extracted policy bundles
+
+    Each bundle generation is extracted into its own directory under cache_dir.
+    New generations are extracted into a staging directory and renamed into
+    place, so a half-extracted tree is never handed to the evaluator.
+    """
+
+    def __init__(self, cache_dir=None, retention=2):
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), 'policy-bundles')
+        self.retention = max(1, retention)
+        self.hits = 0
+        self.misses = 0
+        self.generation = None
+        self._policy_path = None
+        self._lock = threading.Lock()
+
+    def get(self, blob):
+        """
+        Return the extracted policy directory for the current generation of blob
+        """
+        # Metadata-only request; the bundle itself is only fetched on a miss
+        blob.reload()
+        generation = str(blob.generation or blob.etag)
+
+        with self._lock:
+            if generation == self.generation and os.path.isdir(self._policy_path):
+                self.hits += 1
+                logger.info(f"Policy bundle cache hit for generation {generation}")
+                return self._policy_path
+
+            bundle_dir = os.path.join(self.cache_dir, f"gen-{generation}")
+            if os.path.isdir(bundle_dir):
+                # Extracted earlier by this instance but not the active generation
+                self.hits += 1
+                logger.info(f"Reusing extracted policy bundle for generation {generation}")
+            else:
+                self.misses += 1
+                logger.info(f"Policy bundle cache miss, fetching generation {generation}")
+                self._install(blob, generation, bundle_dir)
+
+            self.generation = generation
+            self._policy_path = os.path.join(bundle_dir, 'policies')
+            self._prune()
+
+            return self._policy_path
+
+    def stats(self):
+        """Return cache counters for logging"""
+        return {
+            'generation': self.generation,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    def _install(self, blob, generation, bundle_dir):
+        """Download and extract a bundle generation, then move it into place"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=self.cache_dir)
+
+        try:
+            bundle_file = os.path.join(staging_dir, 'policy-bundle.tar.gz')
+            download_kwargs = {}
+            if blob.generation:
+                # Pin the download to the generation the metadata check saw
+                download_kwargs['if_generation_match'] = blob.generation
+            blob.download_to_filename(bundle_file, **download_kwargs)
+
+            with tarfile.open(bundle_file, 'r:gz') as archive:
+                archive.extractall(staging_dir, members=_safe_members(archive, staging_dir))
+            os.unlink(bundle_file)
+
+            try:
+                os.rename(staging_dir, bundle_dir)
+            except OSError:
+                # Another worker installed the same generation first
+                if not os.path.isdir(bundle_dir):
+                    raise
+                shutil.rmtree(staging_dir, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+    def _prune(self):
+        """Delete extracted generations beyond the retention limit"""
+        try:
+            entries = [
+                os.path.join(self.cache_dir, name)
+                for name in os.listdir(self.cache_dir)
+                if name.startswith('gen-')
+            ]
+        except FileNotFoundError:
+            return
+
+        active_dir = os.path.dirname(self._policy_path)
+        entries.sort(key=os.path.getmtime, reverse=True)
+        kept = 1
+
+        for entry in entries:
+            if entry == active_dir:
+                continue
+            if kept < self.retention:
+                kept += 1
+                continue
+            logger.info(f"Removing stale policy bundle {entry}")
+            shutil.rmtree(entry, ignore_errors=True)
+
+def _safe_members(archive, target_dir):
+    """Yield archive members that extract inside target_dir"""
+    root = os.path.realpath(target_dir)
+    for member in archive.getmembers():
+        destination = os.path.realpath(os.path.join(root, member.name))
+        if member.issym() or member.islnk() or not destination.startswith(root + os.sep):
+            logger.warning(f"Skipping unsafe bundle member: {member.name}")
+            continue
+        yield member
@@ -0,0 +1,207 @@
+"""
+Idempotency Ledger
+Records the outcome of each (message, resource, action) so Pub/Sub
+redeliveries return the recorded outcome instead of repeating API calls
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from google.api_core import exceptions
+
+from clients import get_client
+
+logger = logging.getLogger(__name__)
+
+def ledger_key(message_id, resource, action):
+    """Return the ledger key for one action on one resource in one message"""
+    digest = hashlib.sha256('\0'.join([str(message_id), str(resource), str(action)]).encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+class MemoryLedgerStore:
+    """Per-process store; entries survive only as long as a warm instance"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._records.get(key)
+
+    def put(self, key, record):
+        with self._lock:
+            if len(self._records) >= self.max_entries:
+                now = time.time()
+                self._records = {k: r for k, r in self._records.items() if r['expires_at'] > now}
+                if len(self._records) >= self.max_entries:
+                    self._records.pop(next(iter(self._records)))
+            self._records[key] = record
+        return True
+
+class SQLiteLedgerStore:
+    """Store in a local SQLite file, a stand-in for the shared store in local tests"""
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS ledger (key TEXT PRIMARY KEY, outcome TEXT, expires_at REAL)'
+        )
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT outcome, expires_at FROM ledger WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'outcome': json.loads(row[0]), 'expires_at': row[1]}
+
+    def put(self, key, record):
+        """Insert record unless an unexpired record already holds key"""
+        with self._lock:
+            cursor = self._connection.execute(
+                '''INSERT INTO ledger (key, outcome, expires_at) VALUES (?, ?, ?)
+                   ON CONFLICT(key) DO UPDATE SET outcome = excluded.outcome, expires_at = excluded.expires_at
+                   WHERE ledger.expires_at <= ?''',
+                (key, json.dumps(record['outcome'], default=str), record['expires_at'], time.time())
+            )
+            self._connection.commit()
+            return cursor.rowcount > 0
+
+class GCSLedgerStore:
+    """
+    Store shared by all instances, one object per key in a Cloud Storage bucket
+
+    Records are created with if_generation_match=0, so the first writer wins
+    and an expired record is only replaced at the generation that was read.
+    """
+
+    def __init__(self, bucket_name, prefix='idempotency/'):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+
+    def _blob(self, key):
+        return get_client('storage').bucket(self.bucket_name).blob(f"{self.prefix}{key}")
+
+    def get(self, key):
+        try:
+            return json.loads(self._blob(key).download_as_bytes())
+        except exceptions.NotFound:
+            return None
+
+    def put(self, key, record):
+        payload = json.dumps(record, default=str)
+        blob = self._blob(key)
+        try:
+            blob.upload_from_string(payload, content_type='application/json', if_generation_match=0)
+            return True
+        except exceptions.PreconditionFailed:
+            pass
+
+        blob.reload()
+        existing = json.loads(blob.download_as_bytes(if_generation_match=blob.generation))
+        if existing.get('expires_at', 0) > time.time():
+            return False
+        try:
+            blob.upload_from_string(payload, content_type='application/json', if_generation_match=blob.generation)
+            return True
+        except exceptions.PreconditionFailed:
+            return False
+
+class IdempotencyLedger:
+    """
+    Outcome ledger with a per-process cache in front of an optional shared store
+
+    Lookups check the cache first and cache shared hits; records are written
+    to both. Records expire after ttl_seconds. Store errors are logged and
+    treated as misses, so the ledger never blocks remediation.
+    """
+
+    def __init__(self, store=None, ttl_seconds=86400, local=None):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.local = local or MemoryLedgerStore()
+        self.stats = {'hits': 0, 'misses': 0, 'records': 0, 'errors': 0}
+
+    def lookup(self, message_id, resource, action):
+        """Return the recorded outcome, or None if the action has not completed"""
+        if not message_id:
+            return None
+        key = ledger_key(message_id, resource, action)
+        now = time.time()
+
+        record = self.local.get(key)
+        if (record is None or record['expires_at'] <= now) and self.store is not None:
+            try:
+                record = self.store.get(key)
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.warning(f"Idempotency lookup failed for {resource} {action}: {str(e)}")
+                record = None
+            if record is not None and record['expires_at'] > now:
+                self.local.put(key, record)
+
+        if record is None or record['expires_at'] <= now:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        logger.info(f"Message {message_id} already completed {action} on {resource}")
+        return record['outcome']
+
+    def record(self, message_id, resource, action, outcome):
+        """Record the outcome of a completed action"""
+        if not message_id:
+            return
+        key = ledger_key(message_id, resource, action)
+        record = {'outcome': outcome, 'expires_at': time.time() + self.ttl_seconds}
+        self.local.put(key, record)
+        self.stats['records'] += 1
+        if self.store is not None:
+            try:
+                self.store.put(key, record)
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.warning(f"Idempotency record failed for {resource} {action}: {str(e)}")
+
+def ledger_store_from_env():
+    """Return the shared store named by IDEMPOTENCY_BACKEND (memory, sqlite or gcs)"""
+    backend = os.environ.get('IDEMPOTENCY_BACKEND', 'memory')
+    if backend == 'gcs':
+        return GCSLedgerStore(
+            os.environ['IDEMPOTENCY_BUCKET'],
+            prefix=os.environ.get('IDEMPOTENCY_PREFIX', 'idempotency/')
+        )
+    if backend == 'sqlite':
+        return SQLiteLedgerStore(os.environ.get('IDEMPOTENCY_SQLITE_PATH', '/tmp/idempotency.sqlite3'))
+    if backend != 'memory':
+        raise ValueError(f"Unknown idempotency backend: {backend}")
+    return None
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+def get_ledger():
+    """Return the process-wide ledger, creating it on first use"""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = IdempotencyLedger(
+                store=ledger_store_from_env(),
+                ttl_seconds=int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+            )
+        return _ledger
+
+def set_ledger(ledger):
+    """Replace the process-wide ledger, e.g. with a SQLite-backed one for tests"""
+    global _ledger
+    with _ledger_lock:
+        _ledger = ledger
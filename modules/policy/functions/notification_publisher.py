@@ -0,0 +1,140 @@
+"""
+Notification Publisher
+One Pub/Sub publisher per process with batching enabled; publishes return
+immediately and are awaited together when the invocation flushes
+"""
+
+import json
+import os
+import threading
+import time
+import logging
+from google.cloud import pubsub_v1
+
+logger = logging.getLogger(__name__)
+
+def batch_settings_from_env():
+    """Build publisher batch settings from the PUBSUB_BATCH_* environment variables"""
+    return pubsub_v1.types.BatchSettings(
+        max_messages=int(os.environ.get('PUBSUB_BATCH_MAX_MESSAGES', '100')),
+        max_bytes=int(os.environ.get('PUBSUB_BATCH_MAX_BYTES', str(1024 * 1024))),
+        max_latency=float(os.environ.get('PUBSUB_BATCH_MAX_LATENCY', '0.01'))
+    )
+
+class NotificationPublisher:
+    """
+    Publishes JSON notifications without waiting on each message
+
+    The underlying client is created on first publish and reused across
+    invocations of a warm instance. Futures are tracked until flush(), which
+    waits for all of them and logs publish latency per topic.
+    """
+
+    def __init__(self, project_id=None, batch_settings=None, client_factory=None):
+        self.project_id = project_id
+        self.batch_settings = batch_settings
+        self.client_factory = client_factory
+        self._client = None
+        self._topic_paths = {}
+        self._pending = []
+        self._latencies = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                if self.client_factory is not None:
+                    self._client = self.client_factory()
+                else:
+                    self._client = pubsub_v1.PublisherClient(
+                        batch_settings=self.batch_settings or batch_settings_from_env()
+                    )
+            return self._client
+
+    def topic_path(self, topic_name):
+        """Return the full path of topic_name in the configured project"""
+        if topic_name not in self._topic_paths:
+            project_id = self.project_id or os.environ.get('PROJECT_ID')
+            self._topic_paths[topic_name] = self.client.topic_path(project_id, topic_name)
+        return self._topic_paths[topic_name]
+
+    def publish(self, topic_name, notification, **attributes):
+        """Queue notification as JSON on topic_name and return its future"""
+        data = json.dumps(notification).encode('utf-8')
+        started = time.perf_counter()
+        recorded = threading.Event()
+        future = self.client.publish(self.topic_path(topic_name), data, **attributes)
+
+        def record(done):
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                if done.exception() is None:
+                    self._latencies.setdefault(topic_name, []).append(elapsed_ms)
+                else:
+                    self._failures[topic_name] = self._failures.get(topic_name, 0) + 1
+            recorded.set()
+
+        with self._lock:
+            self._pending.append((topic_name, future, recorded))
+        future.add_done_callback(record)
+        return future
+
+    def flush(self, timeout=60):
+        """
+        Wait for every queued publish, log latency per topic and return the
+        number of messages that failed
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        failed = 0
+        deadline = time.monotonic() + timeout
+        for topic_name, future, recorded in pending:
+            try:
+                message_id = future.result(timeout=max(0, deadline - time.monotonic()))
+                logger.debug(f"Published message {message_id} to {topic_name}")
+            except Exception as e:
+                failed += 1
+                logger.error(f"Failed to publish notification to {topic_name}: {str(e)}")
+            # Callbacks run after waiters are released; let the latency sample land first
+            recorded.wait(max(0, deadline - time.monotonic()))
+
+        if pending:
+            self._log_metrics(len(pending), failed)
+        return failed
+
+    def _log_metrics(self, published, failed):
+        with self._lock:
+            latencies, self._latencies = self._latencies, {}
+            failures, self._failures = self._failures, {}
+
+        for topic_name in sorted(set(latencies) | set(failures)):
+            samples = sorted(latencies.get(topic_name, []))
+            logger.info(json.dumps({
+                'event': 'pubsub_publish',
+                'topic': topic_name,
+                'messages': len(samples),
+                'failed': failures.get(topic_name, 0),
+                'p50_ms': round(samples[len(samples) // 2], 3) if samples else None,
+                'max_ms': round(samples[-1], 3) if samples else None
+            }))
+        logger.info(f"Flushed {published} notifications ({failed} failed)")
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+def get_publisher():
+    """Return the process-wide publisher, creating it on first use"""
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = NotificationPublisher()
+        return _publisher
+
+def set_publisher(publisher):
+    """Replace the process-wide publisher, e.g. with a local fake for tests"""
+    global _publisher
+    with _publisher_lock:
+        _publisher = publisher
@@ -0,0 +1,154 @@
+"""
+Operation Tracker
+Collects the long-running operations started during an invocation and polls
+them together, settling each remediation result once its operations finish
+"""
+
+import os
+import threading
+import time
+import logging
+
+from clients import get_client
+
+logger = logging.getLogger(__name__)
+
+class OperationTracker:
+    """
+    Tracks Compute extended operations and Cloud SQL operations
+
+    track() marks the results an operation belongs to as 'pending' and
+    remembers the status they should get on success. wait() polls every
+    unfinished operation once per round, backing off between rounds. A
+    result is set to its final status once all its operations succeed, or to
+    'failed' as soon as one of them fails. Results still running at the
+    timeout are set to 'timed_out'.
+    """
+
+    def __init__(self, initial_interval=1.0, max_interval=16.0, timeout=300):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self._operations = []
+        self._outstanding = {}
+        self._final_status = {}
+        self._lock = threading.Lock()
+        self.stats = {'operations': 0, 'succeeded': 0, 'failed': 0, 'running': 0, 'polls': 0}
+
+    def track(self, operation, results, kind='compute', project=None):
+        """
+        Register operation for one result dict or a list of them
+
+        kind is 'compute' for ExtendedOperation objects returned by the Compute
+        client, or 'sql' for Cloud SQL operations polled in project.
+        """
+        results = list(results) if isinstance(results, list) else [results]
+        with self._lock:
+            self._operations.append({'operation': operation, 'kind': kind, 'project': project, 'results': results})
+            self.stats['operations'] += 1
+            for result in results:
+                key = id(result)
+                if key not in self._outstanding:
+                    self._final_status[key] = result['status']
+                    self._outstanding[key] = 0
+                self._outstanding[key] += 1
+                result['status'] = 'pending'
+
+    def share(self, result, other):
+        """Settle other together with result, e.g. for a coalesced duplicate violation"""
+        with self._lock:
+            for entry in self._operations:
+                if any(tracked is result for tracked in entry['results']):
+                    entry['results'].append(other)
+                    key = id(other)
+                    self._final_status.setdefault(key, self._final_status.get(id(result)))
+                    self._outstanding[key] = self._outstanding.get(key, 0) + 1
+
+    def wait(self, deadline=None):
+        """
+        Poll tracked operations until all finish, the timeout passes or the
+        time.monotonic() deadline is reached
+        """
+        with self._lock:
+            pending, self._operations = self._operations, []
+        if not pending:
+            return self.stats
+
+        started = time.monotonic()
+        deadline = min(started + self.timeout, deadline if deadline is not None else float('inf'))
+        interval = self.initial_interval
+
+        while pending:
+            still_running = []
+            for entry in pending:
+                done, error = self._poll(entry)
+                if done:
+                    self._settle(entry, error)
+                else:
+                    still_running.append(entry)
+            pending = still_running
+
+            remaining = deadline - time.monotonic()
+            if not pending or remaining <= 0:
+                break
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, self.max_interval)
+
+        for entry in pending:
+            self.stats['running'] += 1
+            for result in entry['results']:
+                if result['status'] == 'pending':
+                    result['status'] = 'timed_out'
+                result['message'] = f"Operation {getattr(entry['operation'], 'name', '')} still running after {time.monotonic() - started:.0f} seconds"
+
+        logger.info(
+            f"Tracked {self.stats['operations']} operations in {time.monotonic() - started:.1f}s: "
+            f"{self.stats['succeeded']} succeeded, {self.stats['failed']} failed, "
+            f"{self.stats['running']} still running ({self.stats['polls']} polls)"
+        )
+        return self.stats
+
+    def _poll(self, entry):
+        """Return (done, error message) for one operation"""
+        self.stats['polls'] += 1
+        operation = entry['operation']
+        try:
+            if entry['kind'] == 'sql':
+                operation = get_client('sql.operations').get(
+                    request={'project': entry['project'], 'operation': operation.name}
+                )
+                entry['operation'] = operation
+                if getattr(operation.status, 'name', operation.status) != 'DONE':
+                    return False, None
+                errors = operation.error.errors if operation.error else []
+                return True, '; '.join(error.message for error in errors) or None
+
+            if not operation.done():
+                return False, None
+            if operation.error_code:
+                return True, f"{operation.error_code}: {operation.error_message}"
+            return True, None
+
+        except Exception as e:
+            logger.warning(f"Failed to poll operation {getattr(operation, 'name', operation)}: {str(e)}")
+            return False, None
+
+    def _settle(self, entry, error):
+        with self._lock:
+            self.stats['failed' if error else 'succeeded'] += 1
+            for result in entry['results']:
+                key = id(result)
+                self._outstanding[key] -= 1
+                if error:
+                    result['status'] = 'failed'
+                    result['error'] = error
+                elif self._outstanding[key] == 0 and result['status'] == 'pending':
+                    result['status'] = self._final_status[key]
+
+def operation_tracker_from_env():
+    """Return a new tracker configured from the OPERATION_* environment variables"""
+    return OperationTracker(
+        initial_interval=float(os.environ.get('OPERATION_POLL_INTERVAL_SECONDS', '1')),
+        max_interval=float(os.environ.get('OPERATION_MAX_POLL_INTERVAL_SECONDS', '16')),
+        timeout=float(os.environ.get('OPERATION_TIMEOUT_SECONDS', '120'))
+    )
@@ -0,0 +1,249 @@
+"""
+Streaming Plan Ingestion
+Reads Terraform plan JSON incrementally from a file-like object, keeping only
+the parts of each resource change that the policies evaluate
+"""
+
+import base64
+import codecs
+import json
+import re
+
+CHUNK_SIZE = 1 << 16
+
+# Fields of a resource change kept in memory; policies read address, type and change.after
+RESOURCE_CHANGE_FIELDS = ('address', 'mode', 'type', 'name', 'provider_name')
+
+_NON_WHITESPACE = re.compile(r'\S')
+_STRUCTURAL = re.compile(r'[\[\]{}"]')
+_STRING_TAIL = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_SCALAR = re.compile(r'[^,}\]\s]*')
+
+class JsonStreamReader:
+    """
+    Minimal pull parser over a binary stream
+
+    Values the caller is not interested in are skipped without being decoded,
+    and only the current chunk (plus any value being read) is held in memory.
+    """
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.position = 0
+        self.mark = None
+        self.eof = False
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it"""
+        while True:
+            match = _NON_WHITESPACE.search(self.buffer, self.position)
+            if match:
+                self.position = match.start()
+                return self.buffer[self.position]
+            self.position = len(self.buffer)
+            if not self._fill():
+                return ''
+
+    def iter_keys(self):
+        """
+        Iterate over the keys of the object at the current position; the
+        caller must read or skip each value before advancing
+        """
+        self._expect('{')
+        if self.peek() == '}':
+            self.position += 1
+            return
+
+        while True:
+            key = self.read_string()
+            self._expect(':')
+            yield key
+            if self._next() == '}':
+                return
+
+    def iter_items(self):
+        """
+        Iterate over the elements of the array at the current position; the
+        caller must read or skip each element before advancing
+        """
+        self._expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+
+        while True:
+            yield
+            if self._next() == ']':
+                return
+
+    def read_string(self):
+        """Read and decode the string at the current position"""
+        if self.peek() != '"':
+            raise ValueError(f"Expected string at offset {self.position}")
+
+        self.mark = self.position
+        self._skip_string()
+        start, self.mark = self.mark, None
+        return json.loads(self.buffer[start:self.position])
+
+    def read_value(self):
+        """Read and decode the value at the current position"""
+        self.peek()
+        self.mark = self.position
+        self.skip_value()
+        start, self.mark = self.mark, None
+        return json.loads(self.buffer[start:self.position])
+
+    def skip_value(self):
+        """Advance past the value at the current position without decoding it"""
+        char = self.peek()
+        if char == '"':
+            self._skip_string()
+        elif char in ('{', '['):
+            self._skip_container()
+        elif char:
+            self._skip_scalar()
+        else:
+            raise ValueError("Unexpected end of JSON stream")
+
+    def _skip_string(self):
+        while True:
+            match = _STRING_TAIL.match(self.buffer, self.position + 1)
+            if match:
+                self.position = match.end()
+                return
+            if not self._fill():
+                raise ValueError("Unterminated string in JSON stream")
+
+    def _skip_container(self):
+        depth = 0
+        while True:
+            match = _STRUCTURAL.search(self.buffer, self.position)
+            if not match:
+                self.position = len(self.buffer)
+                if not self._fill():
+                    raise ValueError("Unterminated container in JSON stream")
+                continue
+
+            char = match.group()
+            self.position = match.start()
+            if char == '"':
+                self._skip_string()
+                continue
+
+            self.position += 1
+            depth += 1 if char in ('{', '[') else -1
+            if depth == 0:
+                return
+
+    def _skip_scalar(self):
+        while True:
+            match = _SCALAR.match(self.buffer, self.position)
+            if match.end() < len(self.buffer) or not self._fill():
+                self.position = match.end()
+                return
+
+    def _expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self.position}")
+        self.position += 1
+
+    def _next(self):
+        char = self.peek()
+        if char not in (',', '}', ']'):
+            raise ValueError(f"Unexpected '{char}' at offset {self.position}")
+        self.position += 1
+        return char
+
+    def _fill(self):
+        """Append the next chunk, dropping text that is no longer needed"""
+        if self.eof:
+            return False
+
+        keep_from = self.position if self.mark is None else self.mark
+        if keep_from:
+            self.buffer = self.buffer[keep_from:]
+            self.position -= keep_from
+            if self.mark is not None:
+                self.mark = 0
+
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            self.buffer += self.decoder.decode(b'', final=True)
+            return False
+
+        self.buffer += self.decoder.decode(chunk)
+        return True
+
+class Base64Reader:
+    """File-like reader that decodes base64 text a chunk at a time"""
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self.data)
+        length = -(-size // 3) * 4
+        piece = self.data[self.offset:self.offset + length]
+        self.offset += len(piece)
+        return base64.b64decode(piece) if piece else b''
+
+def slim_resource_change(change):
+    """Keep only the fields of a resource change that the policies evaluate"""
+    slim = {key: change[key] for key in RESOURCE_CHANGE_FIELDS if key in change}
+    details = change.get('change') or {}
+    slim['change'] = {'actions': details.get('actions'), 'after': details.get('after')}
+    return slim
+
+def read_resource_changes(reader):
+    """
+    Read the plan object at the reader position and return its slimmed
+    resource changes, skipping every other part of the plan
+    """
+    if reader.peek() != '{':
+        reader.skip_value()
+        return None
+
+    resource_changes = []
+    for key in reader.iter_keys():
+        if key == 'resource_changes' and reader.peek() == '[':
+            for _ in reader.iter_items():
+                resource_changes.append(slim_resource_change(reader.read_value()))
+        else:
+            reader.skip_value()
+
+    return resource_changes
+
+def read_plan_document(stream):
+    """Return the slimmed resource changes of a plan JSON document"""
+    return read_resource_changes(JsonStreamReader(stream))
+
+def read_plan_message(stream):
+    """
+    Read a plan event message, returning its metadata fields and the slimmed
+    resource changes of an inline terraform_plan (None when there is none)
+
+    Batch messages carry a 'plans' array; it is returned in metadata['plans']
+    as a list of (plan_metadata, resource_changes) pairs read the same way.
+    """
+    return _read_plan_entry(JsonStreamReader(stream), allow_batch=True)
+
+def _read_plan_entry(reader, allow_batch=False):
+    metadata = {}
+    resource_changes = None
+
+    for key in reader.iter_keys():
+        if key == 'terraform_plan':
+            resource_changes = read_resource_changes(reader)
+        elif key == 'plans' and allow_batch and reader.peek() == '[':
+            metadata['plans'] = [_read_plan_entry(reader) for _ in reader.iter_items()]
+        else:
+            metadata[key] = reader.read_value()
+
+    return metadata, resource_changes
@@ -0,0 +1,277 @@
+"""
+Policy Evaluation Backends
+Evaluates Terraform plans against an extracted policy bundle, either through a
+long-lived local OPA server or by running `opa eval` for each request
+"""
+
+import json
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import http.client
+import logging
+
+logger = logging.getLogger(__name__)
+
+class EvaluationError(RuntimeError):
+    """Raised when a backend fails to evaluate a query"""
+
+class EvaluatorUnavailable(EvaluationError):
+    """Raised when a backend cannot be started in this environment"""
+
+class SubprocessEvaluator:
+    """
+    Runs `opa eval` once per request, passing the input on stdin
+
+    Every call re-parses and re-compiles the bundle, so this is the fallback
+    when a persistent server cannot be used.
+    """
+
+    name = 'subprocess'
+
+    def __init__(self, opa_binary='opa'):
+        self.opa_binary = opa_binary
+
+    def evaluate(self, policy_path, input_data, query='data.terraform'):
+        """Evaluate query against input_data and return the resulting value"""
+        value, _ = self._run(policy_path, input_data, query)
+        return value
+
+    def profile(self, policy_path, input_data, query='data.terraform'):
+        """
+        Evaluate with OPA's profiler enabled and return the value together with
+        the per-expression profile entries
+        """
+        return self._run(policy_path, input_data, query, [
+            '--profile', '--profile-limit', '100000', '--profile-sort', 'total_time_ns'
+        ])
+
+    def _run(self, policy_path, input_data, query, extra_args=()):
+        cmd = [
+            self.opa_binary, 'eval',
+            '--data', policy_path,
+            '--stdin-input',
+            '--format', 'json',
+            *extra_args,
+            query
+        ]
+
+        result = subprocess.run(
+            cmd, input=json.dumps(input_data), capture_output=True, text=True, check=True
+        )
+        evaluation_result = json.loads(result.stdout)
+
+        value = None
+        for query_result in evaluation_result.get('result', []):
+            for expression in query_result.get('expressions', []):
+                value = expression.get('value')
+                break
+            break
+        return value, evaluation_result.get('profile', [])
+
+    def close(self):
+        """Nothing to release for per-request processes"""
+
+class OpaServerEvaluator:
+    """
+    Keeps one `opa run --server` process per bundle version, listening on a Unix socket
+
+    The bundle is compiled once when the server starts; each evaluation is a
+    single HTTP request over the socket with no process spawn or temp file.
+    The server is restarted when a different policy path is requested.
+    """
+
+    name = 'server'
+
+    def __init__(self, opa_binary='opa', socket_path=None, startup_timeout=15, request_timeout=60):
+        self.opa_binary = opa_binary
+        self.socket_path = socket_path or os.path.join(tempfile.gettempdir(), 'opa-policy.sock')
+        self.startup_timeout = startup_timeout
+        self.request_timeout = request_timeout
+        self._process = None
+        self._policy_path = None
+        self._lock = threading.Lock()
+
+    def evaluate(self, policy_path, input_data, query='data.terraform'):
+        """Evaluate query against input_data and return the resulting value"""
+        self._ensure_server(policy_path)
+
+        status, payload = self._request(
+            'POST', '/v1/' + query.replace('.', '/'), json.dumps({'input': input_data})
+        )
+        if status != 200:
+            raise EvaluationError(f"OPA server returned {status}: {payload}")
+
+        return json.loads(payload).get('result')
+
+    def close(self):
+        """Stop the OPA server if one is running"""
+        with self._lock:
+            self._stop()
+
+    def _ensure_server(self, policy_path):
+        """Start or restart the server so it serves policy_path"""
+        with self._lock:
+            if (self._process and self._process.poll() is None
+                    and self._policy_path == policy_path):
+                return
+
+            self._stop()
+            logger.info(f"Starting OPA server for {policy_path}")
+
+            try:
+                self._process = subprocess.Popen(
+                    [
+                        self.opa_binary, 'run', '--server',
+                        '--addr', f"unix://{self.socket_path}",
+                        '--log-level', 'error',
+                        policy_path
+                    ],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.PIPE
+                )
+            except OSError as e:
+                raise EvaluatorUnavailable(f"Cannot start OPA server: {str(e)}")
+
+            self._policy_path = policy_path
+            self._wait_until_healthy()
+
+    def _wait_until_healthy(self):
+        """Poll the health endpoint until the bundle has been loaded"""
+        deadline = time.monotonic() + self.startup_timeout
+
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                stderr = self._process.stderr.read().decode('utf-8', 'replace')
+                self._process = None
+                raise EvaluatorUnavailable(f"OPA server exited during startup: {stderr}")
+            try:
+                status, _ = self._request('GET', '/health')
+                if status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.05)
+
+        self._stop()
+        raise EvaluatorUnavailable("OPA server did not become healthy in time")
+
+    def _request(self, method, path, body=None):
+        """Send one HTTP request to the server over the Unix socket"""
+        connection = _UnixHTTPConnection(self.socket_path, timeout=self.request_timeout)
+        try:
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def _stop(self):
+        if self._process and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        self._process = None
+        self._policy_path = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+class FallbackEvaluator:
+    """
+    Uses the primary backend and switches to the fallback for the rest of the
+    process if the primary cannot be started
+    """
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self._active = primary
+
+    @property
+    def name(self):
+        return self._active.name
+
+    def evaluate(self, policy_path, input_data, query='data.terraform'):
+        if self._active is self.primary:
+            try:
+                return self.primary.evaluate(policy_path, input_data, query)
+            except EvaluatorUnavailable as e:
+                logger.warning(f"{self.primary.name} evaluator unavailable, falling back to {self.fallback.name}: {str(e)}")
+                self._active = self.fallback
+        return self.fallback.evaluate(policy_path, input_data, query)
+
+    def close(self):
+        self.primary.close()
+        self.fallback.close()
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection that connects to a Unix domain socket"""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+_evaluator = None
+_evaluator_lock = threading.Lock()
+
+def get_evaluator():
+    """
+    Return the process-wide evaluator selected by POLICY_EVALUATOR
+    """
+    global _evaluator
+    with _evaluator_lock:
+        if _evaluator is None:
+            _evaluator = create_evaluator(os.environ.get('POLICY_EVALUATOR', 'server'))
+        return _evaluator
+
+def set_evaluator(evaluator):
+    """
+    Replace the process-wide evaluator, e.g. with a local stand-in for tests
+    """
+    global _evaluator
+    with _evaluator_lock:
+        if _evaluator is not None and _evaluator is not evaluator:
+            _evaluator.close()
+        _evaluator = evaluator
+
+def create_evaluator(backend):
+    """Build an evaluator for the named backend"""
+    opa_binary = os.environ.get('OPA_BINARY', 'opa')
+
+    if backend == 'subprocess':
+        return SubprocessEvaluator(opa_binary)
+    if backend == 'server':
+        return FallbackEvaluator(
+            OpaServerEvaluator(opa_binary, socket_path=os.environ.get('OPA_SOCKET_PATH')),
+            SubprocessEvaluator(opa_binary)
+        )
+    raise ValueError(f"Unknown policy evaluator: {backend}")
+
+def extract_violations(document, rules=('deny', 'deny_cross_resource')):
+    """
+    Collect results of the given deny rules from every package in an evaluated
+    data.terraform document
+    """
+    violations = []
+    if not isinstance(document, dict):
+        return violations
+
+    for key in sorted(document):
+        value = document[key]
+        if key in rules:
+            violations.extend(value or [])
+        elif isinstance(value, dict):
+            violations.extend(extract_violations(value, rules))
+
+    return violations
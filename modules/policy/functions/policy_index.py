@@ -0,0 +1,202 @@
+"""
+Policy Index
+Describes the packages and deny rules in an extracted policy bundle, and the
+resource types each rule can match, so the enforcer can query only the rule
+sets that are relevant to a plan
+"""
+
+import os
+import re
+import threading
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Rules evaluated per resource change; safe to evaluate on any subset of a plan
+RESOURCE_RULE = 'deny'
+
+# Rules that look across resource changes; always evaluated on the whole plan
+CROSS_RESOURCE_RULE = 'deny_cross_resource'
+
+PACKAGE_PATTERN = re.compile(r'^package\s+([\w.]+)', re.MULTILINE)
+RULE_HEAD_PATTERN = re.compile(r'^(deny\w*)\s*(?:\[|contains\b)', re.MULTILINE)
+LIST_PATTERN = re.compile(r'^(\w+)\s*:=\s*\[([^\]]*)\]', re.MULTILINE)
+STRING_PATTERN = re.compile(r'"([^"]*)"')
+BINDING_PATTERN = re.compile(r'(\w+)\s*:=\s*input\.resource_changes\[_\]')
+
+# A deny rule body; resource_types is None when the rule can match any type
+PolicyRule = namedtuple('PolicyRule', [
+    'package', 'name', 'resource_types', 'file', 'start_line', 'end_line', 'description'
+])
+
+class RuleSet:
+    """
+    All bodies of one deny rule in one package, queried as data.<package>.<name>
+    """
+
+    def __init__(self, package, name):
+        self.package = package
+        self.name = name
+        self.rules = []
+
+    @property
+    def query(self):
+        return f"data.{self.package}.{self.name}"
+
+    @property
+    def resource_types(self):
+        """Union of matched types, or None if any body matches every type"""
+        types = set()
+        for rule in self.rules:
+            if rule.resource_types is None:
+                return None
+            types.update(rule.resource_types)
+        return types
+
+    def matches(self, plan_types):
+        """Return True if some body can match a resource type in the plan"""
+        resource_types = self.resource_types
+        return resource_types is None or not resource_types.isdisjoint(plan_types)
+
+class PolicyIndex:
+    """
+    Packages, deny rules and matched resource types found in the .rego sources
+    of a bundle
+    """
+
+    def __init__(self):
+        self.packages = {}
+        self.rule_sets = {}
+
+    def add_source(self, source, filename=None):
+        """Record the package, deny rules and their resource types from one .rego file"""
+        package_match = PACKAGE_PATTERN.search(source)
+        if not package_match:
+            return
+
+        package = package_match.group(1)
+        rules = self.packages.setdefault(package, set())
+        lists = {
+            name: set(STRING_PATTERN.findall(values))
+            for name, values in LIST_PATTERN.findall(source)
+        }
+
+        for head in RULE_HEAD_PATTERN.finditer(source):
+            name = head.group(1)
+            rules.add(name)
+
+            rule_set = self.rule_sets.setdefault((package, name), RuleSet(package, name))
+            body, end = _rule_body(source, head.end())
+            rule_set.rules.append(PolicyRule(
+                package, name, _resource_types(body, lists), filename,
+                source.count('\n', 0, head.start()) + 1,
+                source.count('\n', 0, end) + 1,
+                _description(source, head.start())
+            ))
+
+    def queries(self, rule, root='terraform'):
+        """Return data paths for every package under root that defines rule"""
+        return [rule_set.query for rule_set in self.select(rule, root)]
+
+    def find_rule(self, filename, line):
+        """Return the deny rule whose body spans line of filename, if any"""
+        for rule_set in self.rule_sets.values():
+            for rule in rule_set.rules:
+                if rule.file == filename and rule.start_line <= line <= rule.end_line:
+                    return rule
+        return None
+
+    def select(self, rule, root='terraform'):
+        """Return the rule sets named rule for packages under root, in package order"""
+        return [
+            self.rule_sets[key]
+            for key in sorted(self.rule_sets)
+            if key[1] == rule and (key[0] == root or key[0].startswith(root + '.'))
+        ]
+
+def _rule_body(source, start):
+    """Return the text and end offset of the rule body that opens after start"""
+    opening = source.find('{', start)
+    if opening < 0:
+        return '', start
+
+    depth = 0
+    in_string = False
+    position = opening
+    while position < len(source):
+        char = source[position]
+        if in_string:
+            if char == '\\':
+                position += 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return source[opening + 1:position], position
+        position += 1
+
+    return source[opening + 1:], len(source)
+
+def _description(source, start):
+    """Return the comment line directly above the rule head at start"""
+    lines = source[:start].rstrip('\n').split('\n')
+    if lines and lines[-1].lstrip().startswith('#'):
+        return lines[-1].lstrip('# ').strip()
+    return None
+
+def _resource_types(body, lists):
+    """
+    Return the resource types a rule body constrains its resource change to,
+    or None if the body does not constrain the type
+    """
+    types = None
+
+    for variable in BINDING_PATTERN.findall(body):
+        prefix = re.escape(variable) + r'\.type\s*'
+
+        for value in re.findall(prefix + r'==\s*"([^"]+)"', body):
+            types = (types or set()) | {value}
+
+        for values in re.findall(prefix + r'in\s+\[([^\]]*)\]', body):
+            types = (types or set()) | set(STRING_PATTERN.findall(values))
+
+        for list_name in re.findall(prefix + r'in\s+(\w+)', body):
+            if list_name not in lists:
+                return None
+            types = (types or set()) | lists[list_name]
+
+    return types
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def load_policy_index(policy_path):
+    """
+    Return the index for an extracted bundle, building it on first use
+
+    Extracted bundles are immutable per generation, so indexes are cached by path.
+    """
+    with _indexes_lock:
+        if policy_path not in _indexes:
+            _indexes[policy_path] = build_policy_index(policy_path)
+        return _indexes[policy_path]
+
+def build_policy_index(policy_path):
+    """Scan all .rego sources under policy_path, skipping tests"""
+    index = PolicyIndex()
+
+    for directory, _, filenames in os.walk(policy_path):
+        for filename in sorted(filenames):
+            if not filename.endswith('.rego') or filename.endswith('_test.rego'):
+                continue
+            with open(os.path.join(directory, filename)) as f:
+                index.add_source(f.read(), filename)
+
+    logger.info(f"Indexed {len(index.rule_sets)} deny rule sets in {len(index.packages)} policy packages from {policy_path}")
+    return index
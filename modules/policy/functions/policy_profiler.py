@@ -0,0 +1,136 @@
+"""
+Policy Profiler
+Collects per-rule and per-package evaluation cost while plans are evaluated,
+and turns it into structured logs, BigQuery rows and a ranked hot-rule report
+"""
+
+import json
+import os
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+
+from policy_evaluator import SubprocessEvaluator
+
+logger = logging.getLogger(__name__)
+
+class PolicyProfiler:
+    """
+    Evaluates queries with OPA's profiler and aggregates the cost by rule
+
+    OPA reports cost per expression location; locations are attributed to the
+    deny rule whose body contains them using the policy index. Expressions
+    outside deny rules (helpers, constants) are reported by file and line.
+    """
+
+    def __init__(self, index, opa_binary='opa'):
+        self.index = index
+        self.evaluator = SubprocessEvaluator(opa_binary)
+        self.packages = {}
+        self.rules = {}
+        self._lock = threading.Lock()
+
+    def evaluate(self, policy_path, input_data, query='data.terraform'):
+        """Evaluate query with profiling and record its cost"""
+        start = time.perf_counter_ns()
+        value, profile = self.evaluator.profile(policy_path, input_data, query)
+        elapsed_ns = time.perf_counter_ns() - start
+
+        with self._lock:
+            package_stats = self.packages.setdefault(query, {'evaluations': 0, 'total_time_ns': 0})
+            package_stats['evaluations'] += 1
+            package_stats['total_time_ns'] += elapsed_ns
+
+            for entry in profile:
+                self._record_expression(entry)
+
+        return value
+
+    def _record_expression(self, entry):
+        location = entry.get('location') or {}
+        filename = os.path.basename(location.get('file') or '')
+        row = location.get('row') or 0
+        rule = self.index.find_rule(filename, row)
+
+        if rule is not None:
+            key = (rule.file, rule.start_line)
+            details = {
+                'package': rule.package,
+                'rule': rule.name,
+                'file': rule.file,
+                'line': rule.start_line,
+                'description': rule.description
+            }
+        else:
+            key = (filename, row)
+            details = {'package': None, 'rule': None, 'file': filename, 'line': row, 'description': None}
+
+        stats = self.rules.setdefault(key, dict(
+            details, total_time_ns=0, expression_evaluations=0, redos=0
+        ))
+        stats['total_time_ns'] += entry.get('total_time_ns', 0)
+        stats['expression_evaluations'] += entry.get('num_eval', 0)
+        stats['redos'] += entry.get('num_redo', 0)
+
+    def rows(self, bundle_generation=None):
+        """Return BigQuery-ready rows for every profiled rule and package"""
+        timestamp = datetime.now(timezone.utc).isoformat()
+        rows = []
+
+        with self._lock:
+            for stats in self.rules.values():
+                rows.append({
+                    'timestamp': timestamp,
+                    'bundle_generation': bundle_generation,
+                    'scope': 'rule',
+                    'package': stats['package'],
+                    'rule': stats['rule'],
+                    'file': stats['file'],
+                    'line': stats['line'],
+                    'description': stats['description'],
+                    'total_time_ms': stats['total_time_ns'] / 1e6,
+                    'evaluations': None,
+                    'expression_evaluations': stats['expression_evaluations'],
+                    'redos': stats['redos']
+                })
+
+            for query, stats in self.packages.items():
+                package, _, rule = query[len('data.'):].rpartition('.')
+                rows.append({
+                    'timestamp': timestamp,
+                    'bundle_generation': bundle_generation,
+                    'scope': 'package',
+                    'package': package,
+                    'rule': rule,
+                    'file': None,
+                    'line': None,
+                    'description': None,
+                    'total_time_ms': stats['total_time_ns'] / 1e6,
+                    'evaluations': stats['evaluations'],
+                    'expression_evaluations': None,
+                    'redos': None
+                })
+
+        rows.sort(key=lambda row: row['total_time_ms'], reverse=True)
+        return rows
+
+def hot_rules_report(rows, limit=10):
+    """Format the most expensive rules as a ranked, human-readable report"""
+    rule_rows = [row for row in rows if row['scope'] == 'rule'][:limit]
+    total_ms = sum(row['total_time_ms'] for row in rows if row['scope'] == 'rule') or 1
+
+    lines = [f"Hot policy rules (top {len(rule_rows)}):"]
+    for rank, row in enumerate(rule_rows, 1):
+        name = f"{row['package']}.{row['rule']}" if row['package'] else 'helper'
+        lines.append(
+            f"{rank:>3}. {row['total_time_ms']:10.3f} ms {100 * row['total_time_ms'] / total_ms:5.1f}% "
+            f"{row['file']}:{row['line']} {name} {row['description'] or ''}".rstrip()
+        )
+    return '\n'.join(lines)
+
+def log_profile(rows, limit=10):
+    """Emit one structured log line per row followed by the hot-rule report"""
+    for row in rows:
+        logger.info(json.dumps({'event': 'policy_profile', **row}))
+    logger.info(hot_rules_report(rows, limit))
@@ -0,0 +1,223 @@
+"""
+Remediation Executor
+Runs remediations concurrently with per-service rate limits and per-item
+deadlines, returning results in input order
+"""
+
+import json
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# API calls per second and burst size per API, kept well below the default project quotas
+DEFAULT_RATE_LIMITS = {
+    'compute': (10.0, 20),
+    'sql': (2.0, 4),
+    'storage': (20.0, 40)
+}
+
+class DeadlineExceeded(Exception):
+    """Raised when an item does not finish before its deadline"""
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at rate tokens per second up to capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline=None, tokens=1):
+        """
+        Take tokens, waiting for them; return False if deadline passes first
+
+        A request larger than capacity waits for a full bucket and leaves it
+        in debt, so later requests wait for the excess to refill.
+        """
+        needed = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= needed:
+                    self._tokens -= tokens
+                    return True
+                wait = (needed - self._tokens) / self.rate
+
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+class _Start:
+    """Records when a worker picked up an item"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.at = None
+
+    def set(self):
+        self.at = time.monotonic()
+        self.event.set()
+        return self.at
+
+class RemediationExecutor:
+    """
+    Bounded thread pool for remediations
+
+    Each item is routed to the API calls it is expected to make per service,
+    which it must take from those services' token buckets before running,
+    and to a remediator name used for timing. An item's deadline
+    starts when a worker picks it up and covers the wait for a token; no item
+    runs past budget_seconds from the start of run(). Items that raise or miss
+    a deadline are turned into results by the caller's on_failure function.
+    """
+
+    def __init__(self, max_workers=16, rate_limits=None, deadline_seconds=60, budget_seconds=480):
+        self.max_workers = max_workers
+        self.deadline_seconds = deadline_seconds
+        self.budget_seconds = budget_seconds
+        self.buckets = {
+            service: TokenBucket(rate, capacity)
+            for service, (rate, capacity) in (rate_limits or DEFAULT_RATE_LIMITS).items()
+        }
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def run(self, items, function, route, on_failure):
+        """
+        Apply function to every item and return the results in input order
+
+        route(item) returns ({service: API calls}, remediator); on_failure(item, error)
+        builds the result for an item that raised or missed its deadline.
+        """
+        if not items:
+            return []
+
+        budget_deadline = time.monotonic() + self.budget_seconds
+        pool = ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(items))))
+        submitted = []
+        try:
+            for item in items:
+                charges, remediator = route(item)
+                started = _Start()
+                future = pool.submit(self._call, function, item, charges, remediator, started, budget_deadline)
+                submitted.append((item, remediator, started, future))
+
+            results = []
+            for item, remediator, started, future in submitted:
+                try:
+                    if not started.event.wait(max(0, budget_deadline - time.monotonic())):
+                        raise FutureTimeoutError()
+                    deadline = min(started.at + self.deadline_seconds, budget_deadline)
+                    results.append(future.result(timeout=max(0, deadline - time.monotonic())))
+                except FutureTimeoutError:
+                    future.cancel()
+                    self._record(remediator, None, timed_out=True)
+                    logger.error(f"Remediation with {remediator} missed its deadline")
+                    results.append(on_failure(item, DeadlineExceeded(
+                        f"Remediation did not finish within {self.deadline_seconds} seconds"
+                    )))
+                except Exception as e:
+                    results.append(on_failure(item, e))
+            return results
+        finally:
+            # Do not wait on remediations that overran their deadline
+            pool.shutdown(wait=False, cancel_futures=True)
+            self.log_timings()
+
+    def _call(self, function, item, charges, remediator, started, budget_deadline):
+        deadline = min(started.set() + self.deadline_seconds, budget_deadline)
+        for service, calls in sorted((charges or {}).items()):
+            bucket = self.buckets.get(service)
+            if bucket is not None and calls > 0 and not bucket.acquire(deadline, calls):
+                self._record(remediator, None, timed_out=True)
+                raise DeadlineExceeded(f"Rate limit for {service} not available before the deadline")
+
+        began = time.perf_counter()
+        try:
+            result = function(item)
+        except Exception:
+            self._record(remediator, time.perf_counter() - began, failed=True)
+            raise
+        self._record(remediator, time.perf_counter() - began)
+        return result
+
+    def _record(self, remediator, elapsed, failed=False, timed_out=False):
+        with self._lock:
+            stats = self._timings.setdefault(remediator, {
+                'calls': 0, 'failures': 0, 'timeouts': 0, 'total_ms': 0.0, 'max_ms': 0.0
+            })
+            if timed_out:
+                stats['timeouts'] += 1
+                return
+            stats['calls'] += 1
+            stats['failures'] += 1 if failed else 0
+            stats['total_ms'] += elapsed * 1000
+            stats['max_ms'] = max(stats['max_ms'], elapsed * 1000)
+
+    def timings(self):
+        """Return time spent per remediator since the last log_timings()"""
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._timings.items()}
+
+    def log_timings(self):
+        """Log one structured line per remediator and reset the counters"""
+        with self._lock:
+            timings, self._timings = self._timings, {}
+
+        for remediator in sorted(timings):
+            stats = timings[remediator]
+            logger.info(json.dumps({
+                'event': 'remediation_timing',
+                'remediator': remediator,
+                'calls': stats['calls'],
+                'failures': stats['failures'],
+                'timeouts': stats['timeouts'],
+                'total_ms': round(stats['total_ms'], 3),
+                'mean_ms': round(stats['total_ms'] / stats['calls'], 3) if stats['calls'] else None,
+                'max_ms': round(stats['max_ms'], 3)
+            }))
+
+def rate_limits_from_env():
+    """Read per-service limits from REMEDIATION_RATE_<SERVICE> as 'rate' or 'rate:burst'"""
+    limits = {}
+    for service, (rate, capacity) in DEFAULT_RATE_LIMITS.items():
+        value = os.environ.get(f"REMEDIATION_RATE_{service.upper()}")
+        if value:
+            rate_value, _, burst = value.partition(':')
+            rate = float(rate_value)
+            capacity = int(burst) if burst else max(1, int(rate * 2))
+        limits[service] = (rate, capacity)
+    return limits
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_remediation_executor():
+    """
+    Return the process-wide executor, so rate limits hold across invocations
+    on a warm instance
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = RemediationExecutor(
+                max_workers=int(os.environ.get('REMEDIATION_WORKERS', '16')),
+                rate_limits=rate_limits_from_env(),
+                deadline_seconds=float(os.environ.get('REMEDIATION_DEADLINE_SECONDS', '60')),
+                budget_seconds=float(os.environ.get('REMEDIATION_BUDGET_SECONDS', '480'))
+            )
+        return _executor
+
+def set_remediation_executor(executor):
+    """Replace the process-wide executor, e.g. with different limits for tests"""
+    global _executor
+    with _executor_lock:
+        _executor = executor
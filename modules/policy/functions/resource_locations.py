@@ -0,0 +1,145 @@
+"""
+Resource Location Index
+Maps resource names to their zone or region and self link using bulk
+aggregatedList calls, so remediators can address resources without
+per-violation discovery
+"""
+
+import os
+import threading
+import time
+import logging
+from google.cloud import compute_v1
+
+from clients import get_client
+
+logger = logging.getLogger(__name__)
+
+# Terraform type -> (registry client, aggregated list request class, scoped list field)
+LOCATION_SOURCES = {
+    'google_compute_instance': ('compute.instances', 'AggregatedListInstancesRequest', 'instances'),
+    'google_compute_disk': ('compute.disks', 'AggregatedListDisksRequest', 'disks'),
+    'google_compute_address': ('compute.addresses', 'AggregatedListAddressesRequest', 'addresses')
+}
+
+class ResourceLocationIndex:
+    """
+    Cached name -> location entries for one project
+
+    Each resource type is loaded with one paginated aggregatedList call and
+    reloaded when older than ttl_seconds. A name missing from the index
+    reloads its type, at most once per miss_ttl_seconds, in case the
+    resource was created since the last load; names still missing are
+    remembered for miss_ttl_seconds. Lists run outside the index lock, one
+    per type at a time. Lookups that find their name in a stale index use it
+    while another thread reloads.
+    """
+
+    def __init__(self, project_id, ttl_seconds=900, miss_ttl_seconds=60):
+        self.project_id = project_id
+        self.ttl_seconds = ttl_seconds
+        self.miss_ttl_seconds = miss_ttl_seconds
+        self._entries = {}
+        self._loaded_at = {}
+        self._attempted_at = {}
+        self._misses = {}
+        self._lock = threading.Lock()
+        self._load_locks = {resource_type: threading.Lock() for resource_type in LOCATION_SOURCES}
+        self.list_calls = 0
+
+    def lookup(self, resource_type, name):
+        """
+        Return {'zone', 'region', 'self_link'} for a resource, or None when the
+        type is not indexed or the resource cannot be found
+        """
+        if resource_type not in LOCATION_SOURCES:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            if now - self._misses.get((resource_type, name), float('-inf')) <= self.miss_ttl_seconds:
+                return None
+            locations = self._entries.get(resource_type, {}).get(name)
+            stale = now - self._loaded_at.get(resource_type, float('-inf')) > self.ttl_seconds
+
+        if stale or not locations:
+            # A name already indexed is served from the stale index while another thread reloads
+            self._reload(resource_type, wait=not locations)
+            with self._lock:
+                locations = self._entries.get(resource_type, {}).get(name)
+                if not locations:
+                    self._misses[(resource_type, name)] = time.monotonic()
+
+        if not locations:
+            logger.warning(f"No location found for {resource_type}.{name} in {self.project_id}")
+            return None
+        if len(locations) > 1:
+            logger.warning(f"{resource_type}.{name} exists in {len(locations)} locations, using {locations[0]['self_link']}")
+        return locations[0]
+
+    def _reload(self, resource_type, wait=True):
+        """
+        List one type and swap the result into the index, unless it was
+        attempted within miss_ttl_seconds; without wait, return at once if
+        another thread is already listing it
+        """
+        load_lock = self._load_locks[resource_type]
+        if not load_lock.acquire(blocking=wait):
+            return
+        try:
+            started = time.monotonic()
+            with self._lock:
+                if started - self._attempted_at.get(resource_type, float('-inf')) <= self.miss_ttl_seconds:
+                    return
+                self._attempted_at[resource_type] = started
+                self.list_calls += 1
+
+            try:
+                entries = self._list(resource_type)
+            except Exception as e:
+                # Retried after miss_ttl_seconds rather than on every lookup
+                logger.error(f"Failed to list {resource_type} locations in {self.project_id}: {str(e)}")
+                return
+
+            with self._lock:
+                self._entries[resource_type] = entries
+                self._loaded_at[resource_type] = started
+                self._misses = {key: at for key, at in self._misses.items() if key[0] != resource_type}
+            logger.info(f"Indexed locations of {len(entries)} {resource_type} resources in {self.project_id}")
+        finally:
+            load_lock.release()
+
+    def _list(self, resource_type):
+        """Return {name: [location, ...]} for every resource of one type"""
+        client_name, request_name, field = LOCATION_SOURCES[resource_type]
+        request = getattr(compute_v1, request_name)(project=self.project_id, return_partial_success=True)
+
+        entries = {}
+        for scope, scoped_list in get_client(client_name).aggregated_list(request=request):
+            kind, _, location = scope.partition('/')
+            for resource in getattr(scoped_list, field, None) or []:
+                entries.setdefault(resource.name, []).append({
+                    'zone': location if kind == 'zones' else None,
+                    'region': location if kind == 'regions' else None,
+                    'self_link': resource.self_link
+                })
+        return entries
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_location_index(project_id):
+    """Return the process-wide location index for a project, creating it on first use"""
+    with _indexes_lock:
+        if project_id not in _indexes:
+            _indexes[project_id] = ResourceLocationIndex(
+                project_id,
+                ttl_seconds=int(os.environ.get('RESOURCE_LOCATION_TTL_SECONDS', '900')),
+                miss_ttl_seconds=int(os.environ.get('RESOURCE_LOCATION_MISS_TTL_SECONDS', '60'))
+            )
+        return _indexes[project_id]
+
+def set_location_index(index):
+    """Replace the process-wide index for index.project_id, e.g. with a local fake for tests"""
+    with _indexes_lock:
+        _indexes[index.project_id] = index
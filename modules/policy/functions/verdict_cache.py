@@ -0,0 +1,206 @@
+"""
+Verdict Cache
+Stores policy evaluation results keyed by a hash of the normalized Terraform
+plan and the policy bundle generation, so repeated plans are not re-evaluated
+"""
+
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Policies only read input.resource_changes, so only these keys take part in the hash
+NORMALIZED_PLAN_KEYS = ('resource_changes',)
+
+def plan_fingerprint(terraform_plan, bundle_generation):
+    """
+    Return a content hash of the plan fields the policies evaluate plus the
+    bundle generation that evaluated them
+
+    Resource changes are hashed one at a time in address order, so the plan is
+    never serialized as a whole.
+    """
+    digest = hashlib.sha256()
+    digest.update(str(bundle_generation).encode('utf-8'))
+
+    for key in NORMALIZED_PLAN_KEYS:
+        digest.update(b'\0' + key.encode('utf-8'))
+        value = terraform_plan.get(key)
+        if key == 'resource_changes':
+            value = sorted(value or [], key=lambda change: change.get('address') or '')
+            for change in value:
+                digest.update(b'\n' + _canonical_json(change))
+        else:
+            digest.update(_canonical_json(value))
+
+    return digest.hexdigest()
+
+def _canonical_json(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+class MemoryVerdictStore:
+    """In-process LRU store with per-entry TTL, for warm instances"""
+
+    def __init__(self, max_entries=256, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, violations = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            # Callers get their own copy, as they do from the stores that deserialize
+            return copy.deepcopy(violations)
+
+    def set(self, key, violations):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, copy.deepcopy(violations))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class SqliteVerdictStore:
+    """
+    File-backed LRU store with TTL; a local stand-in for a shared store
+    """
+
+    def __init__(self, path, max_entries=10000, ttl_seconds=3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._connection as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS verdicts ('
+                'key TEXT PRIMARY KEY, violations TEXT NOT NULL, '
+                'expires_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._connection as connection:
+            row = connection.execute(
+                'SELECT violations FROM verdicts WHERE key = ? AND expires_at >= ?', (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute('UPDATE verdicts SET accessed_at = ? WHERE key = ?', (now, key))
+            return json.loads(row[0])
+
+    def set(self, key, violations):
+        now = time.time()
+        with self._lock, self._connection as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?)',
+                (key, json.dumps(violations), now + self.ttl_seconds, now)
+            )
+            connection.execute('DELETE FROM verdicts WHERE expires_at < ?', (now,))
+            connection.execute(
+                'DELETE FROM verdicts WHERE key NOT IN '
+                '(SELECT key FROM verdicts ORDER BY accessed_at DESC LIMIT ?)',
+                (self.max_entries,)
+            )
+
+class GcsVerdictStore:
+    """
+    Shared store in a Cloud Storage bucket; entries older than the TTL are
+    ignored and eventually removed by the bucket lifecycle rules
+    """
+
+    def __init__(self, bucket, prefix='verdicts/', ttl_seconds=3600):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key):
+        blob = self.bucket.get_blob(self.prefix + key)
+        if blob is None or blob.time_created.timestamp() + self.ttl_seconds < time.time():
+            return None
+        return json.loads(blob.download_as_bytes())
+
+    def set(self, key, violations):
+        blob = self.bucket.blob(self.prefix + key)
+        blob.upload_from_string(json.dumps(violations), content_type='application/json')
+
+class VerdictCache:
+    """
+    Looks verdicts up in an in-memory tier first and an optional shared tier second
+    """
+
+    def __init__(self, local, shared=None):
+        self.local = local
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return cached violations for key, or None on a miss"""
+        violations = self.local.get(key)
+        if violations is None and self.shared is not None:
+            try:
+                violations = self.shared.get(key)
+            except Exception as e:
+                logger.warning(f"Shared verdict cache lookup failed: {str(e)}")
+            if violations is not None:
+                self.local.set(key, violations)
+
+        if violations is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return violations
+
+    def set(self, key, violations):
+        """Store violations for key in every tier"""
+        self.local.set(key, violations)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, violations)
+            except Exception as e:
+                logger.warning(f"Shared verdict cache write failed: {str(e)}")
+
+    def stats(self):
+        """Return cache counters for logging"""
+        return {'hits': self.hits, 'misses': self.misses}
+
+def create_verdict_cache(bucket_factory=None):
+    """
+    Build a verdict cache from the VERDICT_CACHE_* environment variables
+
+    VERDICT_CACHE_BACKEND selects the shared tier: 'memory' (none), 'sqlite'
+    (VERDICT_CACHE_PATH) or 'gcs' (bucket returned by bucket_factory).
+    """
+    backend = os.environ.get('VERDICT_CACHE_BACKEND', 'memory')
+    ttl_seconds = int(os.environ.get('VERDICT_CACHE_TTL_SECONDS', '3600'))
+    max_entries = int(os.environ.get('VERDICT_CACHE_MAX_ENTRIES', '256'))
+
+    local = MemoryVerdictStore(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    if backend == 'memory':
+        shared = None
+    elif backend == 'sqlite':
+        shared = SqliteVerdictStore(
+            os.environ.get('VERDICT_CACHE_PATH', '/tmp/policy-verdicts.db'), ttl_seconds=ttl_seconds
+        )
+    elif backend == 'gcs':
+        shared = GcsVerdictStore(bucket_factory(), ttl_seconds=ttl_seconds)
+    else:
+        raise ValueError(f"Unknown verdict cache backend: {backend}")
+
+    return VerdictCache(local, shared)
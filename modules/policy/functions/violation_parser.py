@@ -0,0 +1,123 @@
+"""
+Violation Parser
+Normalizes policy violations to the structured form the policies emit and
+classifies legacy message strings in one call per message, shared by the
+enforcer and auto-remediation
+"""
+
+import re
+from functools import lru_cache
+from types import MappingProxyType
+
+# Substrings the classification and severity rules test for in the lowercased message,
+# longer ones first where one contains another
+KEYWORDS = (
+    'public ip', 'public', 'label', 'production', 'encryption', 'bucket',
+    'firewall', 'sql', 'backup', 'admin', 'logging', '0.0.0.0/0'
+)
+
+# Every keyword in one alternation, so a message is scanned once in C rather than once per keyword
+KEYWORD_PATTERN = re.compile('|'.join(re.escape(keyword) for keyword in KEYWORDS))
+
+# The first dotted name in a message, split into type and name when it is a google_* address
+RESOURCE_TOKEN = re.compile(r'\b(?:(?P<type>google_\w+)\.(?P<name>\w+)|\w+\.\w+)')
+
+# A google_* address later in the message, e.g. after a module.<name> prefix
+RESOURCE_ADDRESS = re.compile(r'(?P<type>google_\w+)\.(?P<name>\w+)')
+
+# 'public ip' is matched in place of the 'public' it contains
+HIGH_SEVERITY_KEYWORDS = frozenset(['public', 'public ip', 'encryption', 'firewall', 'admin'])
+MEDIUM_SEVERITY_KEYWORDS = frozenset(['label', 'backup', 'logging'])
+
+def classify(keywords):
+    """Return the remediation type for the set of keywords in a message"""
+    if 'label' in keywords:
+        return 'missing_labels'
+    elif 'public ip' in keywords and 'production' in keywords:
+        return 'public_ip'
+    elif 'encryption' in keywords and 'bucket' in keywords:
+        return 'unencrypted_storage'
+    elif 'firewall' in keywords and '0.0.0.0/0' in keywords:
+        return 'open_firewall'
+    elif 'sql' in keywords and 'public ip' in keywords:
+        return 'sql_public_ip'
+    elif 'backup' in keywords:
+        return 'missing_backup'
+    return 'unknown'
+
+def severity(keywords):
+    """Return high, medium or low for the set of keywords in a message"""
+    if not HIGH_SEVERITY_KEYWORDS.isdisjoint(keywords):
+        return 'high'
+    elif not MEDIUM_SEVERITY_KEYWORDS.isdisjoint(keywords):
+        return 'medium'
+    return 'low'
+
+@lru_cache(maxsize=16384)
+def parse_violation(violation):
+    """
+    Return {'violation_type', 'severity', 'resource_type', 'resource_name',
+    'dotted_name'} for a violation message
+
+    resource_type and resource_name come from the first google_* address and
+    are 'unknown' without one; dotted_name is the first dotted name of any
+    kind. Results are cached per message, so a read-only mapping is returned.
+    """
+    keywords = set(KEYWORD_PATTERN.findall(violation.lower()))
+
+    token = RESOURCE_TOKEN.search(violation)
+    address = None
+    if token is not None:
+        address = token if token.group('type') else RESOURCE_ADDRESS.search(violation, token.start())
+
+    return MappingProxyType({
+        'violation_type': classify(keywords),
+        'severity': severity(keywords),
+        'resource_type': address.group('type') if address else 'unknown',
+        'resource_name': address.group('name') if address else 'unknown',
+        'dotted_name': token.group() if token else 'unknown'
+    })
+
+# Fields of the violation objects emitted by the deny rules in modules/policy/policies
+VIOLATION_FIELDS = ('address', 'type', 'rule_id', 'severity', 'msg')
+
+def normalize_violation(violation):
+    """
+    Return a violation as {'address', 'type', 'rule_id', 'severity', 'msg'}
+
+    Objects emitted by the policies pass through with any missing fields
+    defaulted. Plain message strings, from policies that still return
+    sprintf results or from notifications published before the policies
+    emitted objects, are parsed into the same form with rule_id None.
+    """
+    if isinstance(violation, dict):
+        if all(field in violation for field in VIOLATION_FIELDS):
+            return violation
+        normalized = {
+            'address': None,
+            'type': 'unknown',
+            'rule_id': None,
+            'severity': 'medium',
+            'msg': None
+        }
+        normalized.update(violation)
+        if normalized['msg'] is None:
+            normalized['msg'] = f"{normalized['rule_id']} violated by {normalized['address']}"
+        return normalized
+
+    parsed = parse_violation(violation)
+    address = None
+    if parsed['resource_type'] != 'unknown':
+        address = f"{parsed['resource_type']}.{parsed['resource_name']}"
+    return {
+        'address': address,
+        'type': parsed['resource_type'],
+        'rule_id': None,
+        'severity': parsed['severity'],
+        'msg': violation
+    }
+
+def violation_resource_name(violation):
+    """Return the name of a normalized violation's resource, without module path or index"""
+    address = RESOURCE_ADDRESS.search(violation.get('address') or '')
+    return address.group('name') if address else 'unknown'
@@ -0,0 +1,221 @@
+"""
+Violation Sink
+Writes rows to a BigQuery table with the table metadata cached per process,
+streaming inserts split to fit the request size limit and a batch load job for
+large volumes
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+import logging
+from google.api_core import exceptions
+from google.cloud import bigquery
+
+from clients import get_client
+
+logger = logging.getLogger(__name__)
+
+# Streaming inserts are limited to 10 MB per request; leave room for the request envelope
+DEFAULT_MAX_REQUEST_BYTES = 9 * 1024 * 1024
+DEFAULT_MAX_ROWS_PER_REQUEST = 500
+
+# Approximate per-row envelope added by insert_rows_json (insertId and JSON wrapper)
+ROW_OVERHEAD_BYTES = 64
+
+# Attempts and first backoff for a streaming request that fails transiently
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BACKOFF_SECONDS = 0.5
+
+# Errors worth retrying: server-side and quota failures, an exhausted client
+# retry deadline and transport errors (requests raises OSError subclasses).
+# Anything else, such as a 400 BadRequest, fails the chunk at once
+TRANSIENT_ERRORS = (
+    exceptions.ServerError, exceptions.TooManyRequests, exceptions.RetryError, OSError
+)
+
+class ViolationSink:
+    """
+    Appends rows to one BigQuery table
+
+    Rows are streamed in chunks bounded by max_request_bytes and
+    max_rows_per_request, each row with an insert ID that stays the same
+    across retries so BigQuery drops duplicates of rows that already landed.
+    A request that fails transiently is retried whole, up to max_attempts
+    times with exponential backoff. Rows rejected in a chunk are retried one
+    at a time, since a single invalid row makes BigQuery reject the rest of
+    its request. At or above load_job_threshold rows (0 disables) a batch
+    load job is used instead of streaming.
+    """
+
+    def __init__(self, dataset_id='compliance_data', table_id='policy_violations',
+                 max_request_bytes=DEFAULT_MAX_REQUEST_BYTES,
+                 max_rows_per_request=DEFAULT_MAX_ROWS_PER_REQUEST,
+                 load_job_threshold=0, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 backoff_seconds=DEFAULT_BACKOFF_SECONDS, client_factory=None):
+        self.dataset_id = dataset_id
+        self.table_id = table_id
+        self.max_request_bytes = max_request_bytes
+        self.max_rows_per_request = max_rows_per_request
+        self.load_job_threshold = load_job_threshold
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.client_factory = client_factory or (lambda: get_client('bigquery'))
+        self._client = None
+        self._table = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'rows_written': 0, 'rows_failed': 0, 'requests': 0,
+            'rows_retried': 0, 'requests_retried': 0, 'load_jobs': 0, 'bytes': 0, 'seconds': 0.0
+        }
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self.client_factory()
+            return self._client
+
+    @property
+    def table(self):
+        """Return the table, fetching its metadata once per process"""
+        if self._table is None:
+            client = self.client
+            self._table = client.get_table(client.dataset(self.dataset_id).table(self.table_id))
+        return self._table
+
+    def write(self, rows):
+        """Write rows and return the number that could not be written"""
+        if not rows:
+            return 0
+
+        started = time.perf_counter()
+        if self.load_job_threshold and len(rows) >= self.load_job_threshold:
+            failed = self._load(rows)
+        else:
+            failed = sum(self._insert_chunk(chunk) for chunk in self.chunks(rows))
+
+        self._count(
+            rows_written=len(rows) - failed,
+            rows_failed=failed,
+            seconds=time.perf_counter() - started
+        )
+        return failed
+
+    def chunks(self, rows):
+        """Split rows into lists that fit one streaming insert request"""
+        chunk = []
+        chunk_bytes = 0
+
+        for row in rows:
+            row_bytes = len(json.dumps(row, default=str)) + ROW_OVERHEAD_BYTES
+            if chunk and (chunk_bytes + row_bytes > self.max_request_bytes
+                          or len(chunk) >= self.max_rows_per_request):
+                yield chunk
+                chunk = []
+                chunk_bytes = 0
+            chunk.append(row)
+            chunk_bytes += row_bytes
+
+        if chunk:
+            yield chunk
+
+    def _insert_chunk(self, chunk):
+        """Stream one chunk, retrying rejected rows individually with their insert IDs"""
+        row_ids = [uuid.uuid4().hex for _ in chunk]
+        errors = self._insert(chunk, row_ids)
+        if errors is None:
+            return len(chunk)
+        if not errors:
+            return 0
+
+        failed = 0
+        rejected = sorted({error.get('index', 0) for error in errors})
+        self._count(rows_retried=len(rejected))
+
+        for position in rejected:
+            row_errors = self._insert([chunk[position]], [row_ids[position]])
+            if row_errors is None or row_errors:
+                failed += 1
+                if row_errors:
+                    logger.error(f"Failed to insert row into {self.table_id}: {row_errors[0].get('errors')}")
+
+        return failed
+
+    def _insert(self, rows, row_ids):
+        """
+        Stream rows and return BigQuery's row errors, retrying the whole
+        request on transient failures; return None if the request failed
+        """
+        payload_bytes = sum(len(json.dumps(row, default=str)) for row in rows)
+        for attempt in range(self.max_attempts):
+            self._count(requests=1, bytes=payload_bytes)
+            try:
+                return self.client.insert_rows_json(self.table, rows, row_ids=row_ids)
+            except TRANSIENT_ERRORS as e:
+                if attempt + 1 == self.max_attempts:
+                    logger.error(
+                        f"Streaming insert of {len(rows)} rows into {self.table_id} failed "
+                        f"after {self.max_attempts} attempts: {str(e)}"
+                    )
+                    return None
+                delay = self.backoff_seconds * (2 ** attempt)
+                logger.warning(f"Streaming insert into {self.table_id} failed, retrying in {delay:.1f}s: {str(e)}")
+                self._count(requests_retried=1)
+                time.sleep(delay)
+            except Exception as e:
+                logger.error(f"Streaming insert of {len(rows)} rows into {self.table_id} failed: {str(e)}")
+                return None
+
+    def _load(self, rows):
+        """Append rows with a batch load job, which has no per-request size limit"""
+        table = self.table
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+            schema=table.schema
+        )
+        self._count(load_jobs=1)
+
+        try:
+            self.client.load_table_from_json(rows, table, job_config=job_config).result()
+            return 0
+        except Exception as e:
+            logger.error(f"Load job into {self.table_id} failed, streaming instead: {str(e)}")
+            return sum(self._insert_chunk(chunk) for chunk in self.chunks(rows))
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def stats(self):
+        """Return write counters and throughput for logging"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['rows_per_second'] = stats['rows_written'] / stats['seconds'] if stats['seconds'] else 0.0
+        return stats
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+def get_violation_sink(table_id='policy_violations'):
+    """Return the process-wide sink for a compliance_data table, creating it on first use"""
+    with _sinks_lock:
+        if table_id not in _sinks:
+            _sinks[table_id] = ViolationSink(
+                table_id=table_id,
+                max_request_bytes=int(os.environ.get('VIOLATION_SINK_MAX_REQUEST_BYTES', str(DEFAULT_MAX_REQUEST_BYTES))),
+                max_rows_per_request=int(os.environ.get('VIOLATION_SINK_MAX_ROWS', str(DEFAULT_MAX_ROWS_PER_REQUEST))),
+                load_job_threshold=int(os.environ.get('VIOLATION_SINK_LOAD_THRESHOLD', '10000')),
+                max_attempts=int(os.environ.get('VIOLATION_SINK_MAX_ATTEMPTS', str(DEFAULT_MAX_ATTEMPTS))),
+                backoff_seconds=float(os.environ.get('VIOLATION_SINK_BACKOFF_SECONDS', str(DEFAULT_BACKOFF_SECONDS)))
+            )
+        return _sinks[table_id]
+
+def set_violation_sink(sink):
+    """Replace the process-wide sink for sink.table_id, e.g. with a local fake for tests"""
+    with _sinks_lock:
+        _sinks[sink.table_id] = sink
@@ -100,5 +100,23 @@ resource "google_storage_bucket" "policy_artifacts" {
     }
   }
   
+  # Idempotency ledger records are deleted a week after they are written
+  lifecycle_rule {
+    condition {
+      age            = 7
+      matches_prefix = ["idempotency/"]
+    }
+    action {
+      type = "Delete"
+    }
+  }
+  
   labels = var.labels
+}
+
+# Auto-remediation reads and writes its idempotency ledger in the artifacts bucket
+resource "google_storage_bucket_iam_member" "policy_enforcer_ledger" {
+  bucket = google_storage_bucket.policy_artifacts.name
+  role   = "roles/storage.objectAdmin"
+  member = "serviceAccount:${google_service_account.policy_enforcer.email}"
 }
\ No newline at end of file
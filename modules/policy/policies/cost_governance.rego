@@ -13,55 +13,94 @@ expensive_machine_types := [
     "c2-standard-60"
 ]
 
-deny contains msg if {
+deny contains violation if {
     resource := input.resource_changes[_]
     resource.type == "google_compute_instance"
     resource.change.after.machine_type in expensive_machine_types
     resource.change.after.labels.environment != "prod"
-    msg := sprintf("Instance %s uses expensive machine type %s in non-production", [resource.address, resource.change.after.machine_type])
+    violation := {
+        "address": resource.address,
+        "type": resource.type,
+        "rule_id": "cost.governance.expensive_machine_type",
+        "severity": "low",
+        "msg": sprintf("Instance %s uses expensive machine type %s in non-production", [resource.address, resource.change.after.machine_type])
+    }
 }
 
+# Cross-resource rules are declared as deny_cross_resource so sharded
+# evaluation always runs them against the whole plan
+
 # Require budget alerts for all projects
-deny contains msg if {
+deny_cross_resource contains violation if {
     resource := input.resource_changes[_]
     resource.type == "google_project"
     not has_budget_alert(resource.change.after.project_id)
-    msg := sprintf("Project %s must have budget alerts configured", [resource.change.after.project_id])
+    violation := {
+        "address": resource.address,
+        "type": resource.type,
+        "rule_id": "cost.governance.budget_alerts",
+        "severity": "low",
+        "msg": sprintf("Project %s must have budget alerts configured", [resource.change.after.project_id])
+    }
 }
 
 # Deny persistent disks without lifecycle management
-deny contains msg if {
+deny contains violation if {
     resource := input.resource_changes[_]
     resource.type == "google_compute_disk"
     resource.change.after.size > 100
     not resource.change.after.labels.lifecycle_policy
-    msg := sprintf("Large disk %s must have lifecycle policy label", [resource.address])
+    violation := {
+        "address": resource.address,
+        "type": resource.type,
+        "rule_id": "cost.governance.disk_lifecycle_label",
+        "severity": "low",
+        "msg": sprintf("Large disk %s must have lifecycle policy label", [resource.address])
+    }
 }
 
 # Require committed use discounts for production workloads
-deny contains msg if {
+deny_cross_resource contains violation if {
     resource := input.resource_changes[_]
     resource.type == "google_compute_instance"
     resource.change.after.labels.environment == "prod"
     not has_commitment(resource.change.after.zone)
-    msg := sprintf("Production instance %s should use committed use discounts", [resource.address])
+    violation := {
+        "address": resource.address,
+        "type": resource.type,
+        "rule_id": "cost.governance.committed_use_discounts",
+        "severity": "low",
+        "msg": sprintf("Production instance %s should use committed use discounts", [resource.address])
+    }
 }
 
 # Deny oversized Cloud SQL instances in development
-deny contains msg if {
+deny contains violation if {
     resource := input.resource_changes[_]
     resource.type == "google_sql_database_instance"
     resource.change.after.labels.environment == "dev"
     resource.change.after.settings[0].tier in ["db-n1-highmem-64", "db-n1-standard-64"]
-    msg := sprintf("Development SQL instance %s is oversized", [resource.address])
+    violation := {
+        "address": resource.address,
+        "type": resource.type,
+        "rule_id": "cost.governance.sql_oversized",
+        "severity": "low",
+        "msg": sprintf("Development SQL instance %s is oversized", [resource.address])
+    }
 }
 
 # Require cost center labels for billing allocation
-deny contains msg if {
+deny contains violation if {
     resource := input.resource_changes[_]
     resource.type in billable_resources
     not resource.change.after.labels.cost_center
-    msg := sprintf("Billable resource %s must have cost_center label", [resource.address])
+    violation := {
+        "address": resource.address,
+        "type": resource.type,
+        "rule_id": "cost.governance.cost_center_label",
+        "severity": "low",
+        "msg": sprintf("Billable resource %s must have cost_center label", [resource.address])
+    }
 }
 
 billable_resources := [
@@ -143,6 +143,7 @@ resource "google_cloudfunctions_function" "policy_enforcer" {
   environment_variables = {
     POLICY_BUNDLE_URL = "gs://${google_storage_bucket.policy_artifacts.name}/bundles/policy-bundle-latest.tar.gz"
     PROJECT_ID        = var.project_id
+    POLICY_EVALUATOR  = "server"
   }
 
   service_account_email = google_service_account.policy_enforcer.email
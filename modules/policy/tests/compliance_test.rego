@@ -88,4 +88,25 @@ test_ssh_from_internet {
             }
         }]
     }
+}
+
+test_sql_public_ip_violation_fields {
+    violation := deny[_] with input as {
+        "resource_changes": [{
+            "address": "google_sql_database_instance.test",
+            "type": "google_sql_database_instance",
+            "change": {
+                "after": {
+                    "settings": [{
+                        "ip_configuration": [{
+                            "ipv4_enabled": true
+                        }]
+                    }]
+                }
+            }
+        }]
+    }
+    violation.rule_id == "compliance.cis_2_2_sql_public_ip"
+    violation.severity == "high"
+    violation.address == "google_sql_database_instance.test"
 }
\ No newline at end of file
@@ -178,4 +178,64 @@ test_sensitive_role_condition_present if {
             }
         }]
     }
-}
\ No newline at end of file
+}
+
+test_critical_service_audit_config_required if {
+    deny_cross_resource[_] with input as {
+        "resource_changes": [{
+            "address": "google_project_service.sql",
+            "type": "google_project_service",
+            "change": {
+                "after": {
+                    "project": "test-project",
+                    "service": "cloudsql.googleapis.com"
+                }
+            }
+        }]
+    }
+}
+
+test_critical_service_audit_config_present if {
+    count(deny_cross_resource) == 0 with input as {
+        "resource_changes": [
+            {
+                "address": "google_project_service.sql",
+                "type": "google_project_service",
+                "change": {
+                    "after": {
+                        "project": "test-project",
+                        "service": "cloudsql.googleapis.com"
+                    }
+                }
+            },
+            {
+                "address": "google_project_iam_audit_config.sql",
+                "type": "google_project_iam_audit_config",
+                "change": {
+                    "after": {
+                        "project": "test-project"
+                    }
+                }
+            }
+        ]
+    }
+}
+
+# Test that violations identify the rule and resource
+test_violation_fields if {
+    some violation in deny with input as {
+        "resource_changes": [{
+            "address": "module.app.google_compute_instance.test",
+            "type": "google_compute_instance",
+            "change": {
+                "after": {
+                    "labels": {}
+                }
+            }
+        }]
+    }
+    violation.rule_id == "security.enhanced.security_classification_label"
+    violation.severity == "medium"
+    violation.address == "module.app.google_compute_instance.test"
+    violation.type == "google_compute_instance"
+}
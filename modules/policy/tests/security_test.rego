@@ -72,4 +72,23 @@ test_firewall_allows_all_traffic {
             }
         }]
     }
+}
+
+test_violation_carries_rule_id_and_address {
+    violation := deny[_] with input as {
+        "resource_changes": [{
+            "address": "module.app.google_compute_firewall.test",
+            "type": "google_compute_firewall",
+            "change": {
+                "after": {
+                    "source_ranges": ["0.0.0.0/0"],
+                    "direction": "INGRESS"
+                }
+            }
+        }]
+    }
+    violation.rule_id == "security.firewall_open_ingress"
+    violation.severity == "high"
+    violation.address == "module.app.google_compute_firewall.test"
+    violation.type == "google_compute_firewall"
 }
\ No newline at end of file
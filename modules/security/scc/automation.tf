@@ -33,6 +33,10 @@ resource "google_cloudfunctions2_function" "finding_processor" {
     max_instance_count = 10
     available_memory   = "256M"
     timeout_seconds    = 60
+    environment_variables = {
+      IDEMPOTENCY_BACKEND = "gcs"
+      IDEMPOTENCY_BUCKET  = google_storage_bucket.function_source[0].name
+    }
   }
 }
 
@@ -41,11 +45,48 @@ resource "google_storage_bucket" "function_source" {
   name     = "${var.project_id}-scc-function-source"
   project  = var.project_id
   location = "US"
+  
+  # Idempotency ledger records are deleted a week after they are written
+  lifecycle_rule {
+    condition {
+      age            = 7
+      matches_prefix = ["idempotency/"]
+    }
+    action {
+      type = "Delete"
+    }
+  }
 }
 
 resource "google_storage_bucket_object" "function_source" {
   count  = var.auto_remediation_enabled ? 1 : 0
   name   = "function-source.zip"
   bucket = google_storage_bucket.function_source[0].name
-  source = "${path.module}/templates/finding_processor.py"
+  source = data.archive_file.finding_processor_zip[0].output_path
+}
+
+# The processor imports the shared idempotency ledger and client registry, so they ship alongside it
+data "archive_file" "finding_processor_zip" {
+  count = var.auto_remediation_enabled ? 1 : 0
+
+  type        = "zip"
+  output_path = "/tmp/scc-finding-processor.zip"
+  
+  source {
+    content = templatefile("${path.module}/templates/finding_processor.py", {
+      project_id = var.project_id
+      org_id     = var.organization_id
+    })
+    filename = "main.py"
+  }
+  
+  source {
+    content  = file("${path.module}/templates/idempotency.py")
+    filename = "idempotency.py"
+  }
+  
+  source {
+    content  = file("${path.module}/templates/clients.py")
+    filename = "clients.py"
+  }
 }
\ No newline at end of file
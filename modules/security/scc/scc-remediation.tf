@@ -23,15 +23,34 @@ resource "google_cloudfunctions2_function" "auto_remediation" {
     available_memory   = "512M"
     timeout_seconds    = 300
     environment_variables = {
-      PROJECT_ID = var.project_id
-      ORG_ID     = var.organization_id
+      PROJECT_ID          = var.project_id
+      ORG_ID              = var.organization_id
+      IDEMPOTENCY_BACKEND = "gcs"
+      IDEMPOTENCY_BUCKET  = google_storage_bucket.remediation_source[0].name
+      PLAYBOOK_BUCKET     = google_storage_bucket.remediation_playbooks[0].name
+
+      FINDING_DEDUP_WINDOW_SECONDS = var.finding_dedup_window_seconds
+    }
+  }
+  
+  # With the finding worker enabled, findings are pulled from the remediation
+  # subscription in batches instead of triggering one invocation each
+  dynamic "event_trigger" {
+    for_each = var.finding_worker_enabled ? [] : [1]
+    content {
+      trigger_region = "us-central1"
+      event_type     = "google.cloud.pubsub.topic.v1.messagePublished"
+      pubsub_topic   = google_pubsub_topic.scc_findings[0].id
     }
   }
   
-  event_trigger {
-    trigger_region = "us-central1"
-    event_type     = "google.cloud.pubsub.topic.v1.messagePublished"
-    pubsub_topic   = google_pubsub_topic.scc_findings[0].id
+  # The worker is deployed outside this module; removing the trigger without
+  # one would silently stop all remediation
+  lifecycle {
+    precondition {
+      condition     = !var.finding_worker_enabled || var.finding_worker_target != ""
+      error_message = "finding_worker_enabled removes the remediation function's Pub/Sub trigger; deploy templates/finding_worker.py and set finding_worker_target first."
+    }
   }
 }
 
@@ -43,14 +62,66 @@ resource "google_storage_bucket" "remediation_source" {
   location = "US"
   
   uniform_bucket_level_access = true
+  
+  # Idempotency ledger records are deleted a week after they are written
+  lifecycle_rule {
+    condition {
+      age            = 7
+      matches_prefix = ["idempotency/"]
+    }
+    action {
+      type = "Delete"
+    }
+  }
 }
 
-# Remediation function source code
+# Remediation function source code; the object name carries the archive hash so
+# a change to any module or playbook redeploys the function
 resource "google_storage_bucket_object" "remediation_source" {
   count  = var.auto_remediation_enabled ? 1 : 0
-  name   = "remediation-source.zip"
+  name   = "remediation-source-${data.archive_file.remediation_function_zip[0].output_md5}.zip"
   bucket = google_storage_bucket.remediation_source[0].name
-  source = "${path.module}/templates/remediation_function.zip"
+  source = data.archive_file.remediation_function_zip[0].output_path
+}
+
+# The function imports its sibling modules (client registry, idempotency ledger,
+# dedup window, audit sink, scheduler, playbook engine), so they ship alongside
+# it with the playbooks and requirements
+data "archive_file" "remediation_function_zip" {
+  count = var.auto_remediation_enabled ? 1 : 0
+
+  type        = "zip"
+  output_path = "/tmp/scc-remediation-function.zip"
+
+  source {
+    content  = "from remediation_function import remediate_finding\n"
+    filename = "main.py"
+  }
+
+  dynamic "source" {
+    for_each = toset([
+      "remediation_function.py",
+      "clients.py",
+      "idempotency.py",
+      "finding_dedup.py",
+      "audit_sink.py",
+      "remediation_scheduler.py",
+      "playbook_engine.py",
+      "requirements.txt"
+    ])
+    content {
+      content  = file("${path.module}/templates/${source.value}")
+      filename = source.value
+    }
+  }
+
+  dynamic "source" {
+    for_each = fileset("${path.module}/templates/playbooks", "*.yaml")
+    content {
+      content  = file("${path.module}/templates/playbooks/${source.value}")
+      filename = "playbooks/${source.value}"
+    }
+  }
 }
 
 # Pub/Sub subscription for remediation
@@ -72,6 +143,14 @@ resource "google_pubsub_subscription" "remediation_subscription" {
   }
 }
 
+# The finding worker pulls from the remediation subscription as the remediation service account
+resource "google_pubsub_subscription_iam_member" "finding_worker" {
+  count        = var.auto_remediation_enabled && var.finding_worker_enabled ? 1 : 0
+  subscription = google_pubsub_subscription.remediation_subscription[0].name
+  role         = "roles/pubsub.subscriber"
+  member       = "serviceAccount:${google_service_account.remediation_sa[0].email}"
+}
+
 # Dead letter topic for failed remediations
 resource "google_pubsub_topic" "remediation_dead_letter" {
   count   = var.auto_remediation_enabled ? 1 : 0
@@ -0,0 +1,259 @@
+"""
+Audit Sink
+Buffers remediation audit rows in memory and writes them to BigQuery from a
+background thread, in chunks sized to the streaming insert limits, with a
+local spool file for rows BigQuery could not take
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+import logging
+
+from clients import get_client
+
+logger = logging.getLogger(__name__)
+
+# Streaming inserts are limited to 10 MB per request; leave room for the request envelope
+DEFAULT_MAX_REQUEST_BYTES = 9 * 1024 * 1024
+DEFAULT_MAX_ROWS_PER_REQUEST = 500
+
+# Approximate per-row envelope added by insert_rows_json (insertId and JSON wrapper)
+ROW_OVERHEAD_BYTES = 64
+
+class AuditSink:
+    """
+    Appends remediation audit rows to one BigQuery table off the remediation path
+
+    write() only buffers a row. A flusher thread writes the buffer once it
+    holds max_buffer_rows rows or its oldest row has waited
+    max_buffer_seconds, and close() (registered with atexit) writes what is
+    left. Rows are streamed in chunks bounded by max_request_bytes and
+    max_rows_per_request. When a request fails, its rows are appended to
+    spool_path as JSON lines and sent again with the next flush; rows that
+    BigQuery rejects individually are logged and dropped, since sending them
+    again would fail the same way. spool_pending() moves the buffer to the
+    spool file without a BigQuery round trip, for callers that may be
+    suspended before the flusher runs, and wakes the flusher to send it.
+    """
+
+    def __init__(self, table_id, max_buffer_rows=100, max_buffer_seconds=5.0,
+                 max_request_bytes=DEFAULT_MAX_REQUEST_BYTES,
+                 max_rows_per_request=DEFAULT_MAX_ROWS_PER_REQUEST,
+                 spool_path='/tmp/remediation_audit.jsonl', client_factory=None):
+        self.table_id = table_id
+        self.max_buffer_rows = max_buffer_rows
+        self.max_buffer_seconds = max_buffer_seconds
+        self.max_request_bytes = max_request_bytes
+        self.max_rows_per_request = max_rows_per_request
+        self.spool_path = spool_path
+        self.client_factory = client_factory or (lambda: get_client('bigquery'))
+        self._client = None
+        self._rows = []
+        self._oldest = None
+        self._closed = False
+        self._thread = None
+        # Set when spooled rows should be sent without waiting for new ones,
+        # e.g. rows parked by an earlier invocation
+        self._replay = os.path.exists(spool_path)
+        self._condition = threading.Condition()
+        # Serializes flushes between the flusher thread and close()
+        self._flush_lock = threading.Lock()
+        # Keeps appends to the spool file out of the replay rename
+        self._spool_lock = threading.Lock()
+        self._stats = {
+            'rows_buffered': 0, 'rows_written': 0, 'rows_spooled': 0, 'rows_replayed': 0,
+            'rows_failed': 0, 'requests': 0, 'flushes': 0, 'seconds': 0.0
+        }
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self.client_factory()
+        return self._client
+
+    def write(self, row):
+        """Buffer one row; never waits on BigQuery"""
+        with self._condition:
+            if self._closed:
+                self._spool([row])
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-sink', daemon=True)
+                self._thread.start()
+            if not self._rows:
+                self._oldest = time.monotonic()
+            self._rows.append(row)
+            self._stats['rows_buffered'] += 1
+            if len(self._rows) == 1 or len(self._rows) >= self.max_buffer_rows:
+                self._condition.notify()
+
+    def spool_pending(self):
+        """Move buffered rows to the spool file and wake the flusher; never waits on BigQuery"""
+        with self._condition:
+            rows, self._rows = self._rows, []
+        if rows:
+            self._spool(rows)
+        with self._condition:
+            if rows:
+                self._replay = True
+            if self._replay and self._thread is not None:
+                self._condition.notify()
+
+    def pending(self):
+        """Return the number of buffered rows not yet flushed"""
+        with self._condition:
+            return len(self._rows)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and not self._replay and len(self._rows) < self.max_buffer_rows:
+                    if self._rows:
+                        remaining = self._oldest + self.max_buffer_seconds - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                if self._closed:
+                    return
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows and any spooled rows; return the number written"""
+        with self._flush_lock:
+            with self._condition:
+                rows, self._rows = self._rows, []
+                self._replay = False
+            replayed = self._take_spool()
+            rows = replayed + rows
+            if not rows:
+                return 0
+
+            started = time.perf_counter()
+            written = 0
+            for chunk in self.chunks(rows):
+                written += self._insert_chunk(chunk)
+
+            with self._condition:
+                self._stats['flushes'] += 1
+                self._stats['rows_written'] += written
+                self._stats['rows_replayed'] += len(replayed)
+                self._stats['seconds'] += time.perf_counter() - started
+            return written
+
+    def close(self):
+        """Stop the flusher thread and write what is left; later rows go to the spool file"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        self.log_stats()
+
+    def chunks(self, rows):
+        """Split rows into lists that fit one streaming insert request"""
+        chunk = []
+        chunk_bytes = 0
+
+        for row in rows:
+            row_bytes = len(json.dumps(row, default=str)) + ROW_OVERHEAD_BYTES
+            if chunk and (chunk_bytes + row_bytes > self.max_request_bytes
+                          or len(chunk) >= self.max_rows_per_request):
+                yield chunk
+                chunk = []
+                chunk_bytes = 0
+            chunk.append(row)
+            chunk_bytes += row_bytes
+
+        if chunk:
+            yield chunk
+
+    def _insert_chunk(self, chunk):
+        """Stream one chunk and return the rows written, spooling it if the request fails"""
+        with self._condition:
+            self._stats['requests'] += 1
+        try:
+            errors = self.client.insert_rows_json(self.table_id, chunk)
+        except Exception as e:
+            logger.error(f"Audit insert into {self.table_id} failed, spooling {len(chunk)} rows: {str(e)}")
+            self._spool(chunk)
+            return 0
+
+        rejected = {error.get('index', 0): error.get('errors') for error in errors or []}
+        for position, row_errors in sorted(rejected.items()):
+            logger.error(f"Audit row rejected by {self.table_id}: {chunk[position]} {row_errors}")
+        with self._condition:
+            self._stats['rows_failed'] += len(rejected)
+        return len(chunk) - len(rejected)
+
+    def _spool(self, rows):
+        """Append rows to the spool file, where the next flush picks them up"""
+        try:
+            with self._spool_lock, open(self.spool_path, 'a') as spool:
+                for row in rows:
+                    spool.write(json.dumps(row, default=str) + '\n')
+            with self._condition:
+                self._stats['rows_spooled'] += len(rows)
+        except OSError as e:
+            logger.error(f"Failed to spool {len(rows)} audit rows to {self.spool_path}: {str(e)}")
+            with self._condition:
+                self._stats['rows_failed'] += len(rows)
+
+    def _take_spool(self):
+        """Return and remove the rows spooled by earlier flushes"""
+        if not os.path.exists(self.spool_path):
+            return []
+        replaying = f"{self.spool_path}.replay"
+        try:
+            with self._spool_lock:
+                os.replace(self.spool_path, replaying)
+            with open(replaying) as spool:
+                rows = [json.loads(line) for line in spool if line.strip()]
+            os.remove(replaying)
+            return rows
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read spooled audit rows from {self.spool_path}: {str(e)}")
+            return []
+
+    def stats(self):
+        """Return write counters for logging"""
+        with self._condition:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._rows)
+        return stats
+
+    def log_stats(self):
+        logger.info(json.dumps({'event': 'audit_sink', 'table': self.table_id, **self.stats()}))
+
+_sink = None
+_sink_lock = threading.Lock()
+
+def get_audit_sink(project_id=None):
+    """Return the process-wide audit sink, creating it on first use and flushing it at exit"""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            project_id = project_id or os.environ.get('PROJECT_ID')
+            _sink = AuditSink(
+                f"{project_id}.scc_remediation_audit.remediation_log",
+                max_buffer_rows=int(os.environ.get('AUDIT_BUFFER_ROWS', '100')),
+                max_buffer_seconds=float(os.environ.get('AUDIT_BUFFER_SECONDS', '5')),
+                max_request_bytes=int(os.environ.get('AUDIT_MAX_REQUEST_BYTES', str(DEFAULT_MAX_REQUEST_BYTES))),
+                max_rows_per_request=int(os.environ.get('AUDIT_MAX_ROWS', str(DEFAULT_MAX_ROWS_PER_REQUEST))),
+                spool_path=os.environ.get('AUDIT_SPOOL_PATH', '/tmp/remediation_audit.jsonl')
+            )
+            atexit.register(_sink.close)
+        return _sink
+
+def set_audit_sink(sink):
+    """Replace the process-wide audit sink, e.g. with one writing to a local fake for tests"""
+    global _sink
+    with _sink_lock:
+        _sink = sink
@@ -0,0 +1,63 @@
+"""
+Client Registry
+Process-wide Google Cloud API clients, created on first use and reused across
+warm invocations (the SCC functions deploy separately from modules/policy, so
+they carry their own registry with the same interface)
+"""
+
+import importlib
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Registry name -> (module, class); modules are imported only when a client is first needed
+CLIENT_CLASSES = {
+    'securitycenter': ('google.cloud.securitycenter', 'SecurityCenterClient'),
+    'compute.instances': ('google.cloud.compute_v1', 'InstancesClient'),
+    'storage': ('google.cloud.storage', 'Client'),
+    'bigquery': ('google.cloud.bigquery', 'Client'),
+    'pubsub.subscriber': ('google.cloud.pubsub_v1', 'SubscriberClient')
+}
+
+_clients = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+def get_client(name):
+    """
+    Return the shared client registered under name, constructing it on first use
+
+    Construction is serialized per client so concurrent first calls build it once.
+    """
+    client = _clients.get(name)
+    if client is not None:
+        return client
+
+    with _registry_lock:
+        lock = _locks.setdefault(name, threading.Lock())
+
+    with lock:
+        client = _clients.get(name)
+        if client is None:
+            if name not in CLIENT_CLASSES:
+                raise KeyError(f"Unknown client: {name}")
+            module_name, class_name = CLIENT_CLASSES[name]
+
+            started = time.perf_counter()
+            client = getattr(importlib.import_module(module_name), class_name)()
+            logger.info(f"Created {name} client in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+            _clients[name] = client
+        return client
+
+def set_client(name, client):
+    """Register client under name, e.g. a local fake for tests"""
+    with _registry_lock:
+        _clients[name] = client
+
+def clear_clients():
+    """Drop every registered client so the next use constructs a new one"""
+    with _registry_lock:
+        _clients.clear()
@@ -0,0 +1,94 @@
+"""
+Finding Deduplication
+Absorbs findings SCC re-emits for a resource and category that was already
+remediated within a time window, and counts the remediation calls saved
+"""
+
+import json
+import os
+import threading
+import logging
+
+from idempotency import IdempotencyLedger, ledger_store_from_env
+from remediation_scheduler import remediation_service
+
+logger = logging.getLogger(__name__)
+
+# Ledger scope of the window records, kept apart from per-message records
+DEDUP_SCOPE = 'dedup-window'
+
+# API calls one remediation makes per service, to report the calls saved
+REMEDIATION_API_CALLS = {
+    'compute': 3,
+    'storage': 2,
+    'iam': 0
+}
+
+def remediation_api_calls(category):
+    """Return the API calls remediating one finding of category makes"""
+    return REMEDIATION_API_CALLS.get(remediation_service(category), 0)
+
+class FindingDeduplicator:
+    """
+    Window of recently remediated (resource, category) pairs
+
+    A successful remediation is remembered for window_seconds in an
+    idempotency ledger (per-process cache plus the optional shared store);
+    later findings for the pair inside the window are absorbed. A window of
+    0 disables deduplication.
+    """
+
+    def __init__(self, window_seconds=3600, store=None):
+        self.window_seconds = window_seconds
+        self.ledger = IdempotencyLedger(store=store, ttl_seconds=window_seconds) if window_seconds > 0 else None
+        self.stats = {'suppressed': 0, 'merged': 0, 'api_calls_saved': 0}
+        self._lock = threading.Lock()
+
+    def seen(self, resource_name, category):
+        """Return the outcome remembered for a pair within the window, or None"""
+        if self.ledger is None:
+            return None
+        outcome = self.ledger.lookup(DEDUP_SCOPE, resource_name, category)
+        if outcome is not None:
+            with self._lock:
+                self.stats['suppressed'] += 1
+                self.stats['api_calls_saved'] += remediation_api_calls(category)
+        return outcome
+
+    def remember(self, resource_name, category, outcome):
+        """Start the window for a successfully remediated pair"""
+        if self.ledger is not None:
+            self.ledger.record(DEDUP_SCOPE, resource_name, category, outcome)
+
+    def merged(self, category):
+        """Count a category whose remediation was merged into another category's pass"""
+        with self._lock:
+            self.stats['merged'] += 1
+            self.stats['api_calls_saved'] += remediation_api_calls(category)
+
+    def log_stats(self):
+        """Log the suppression counts since the process started"""
+        with self._lock:
+            stats = dict(self.stats)
+        logger.info(json.dumps({'event': 'finding_dedup', 'window_seconds': self.window_seconds, **stats}))
+
+_deduplicator = None
+_deduplicator_lock = threading.Lock()
+
+def get_deduplicator():
+    """Return the process-wide deduplicator, sharing the idempotency ledger's store"""
+    global _deduplicator
+    with _deduplicator_lock:
+        if _deduplicator is None:
+            window_seconds = int(os.environ.get('FINDING_DEDUP_WINDOW_SECONDS', '3600'))
+            _deduplicator = FindingDeduplicator(
+                window_seconds=window_seconds,
+                store=ledger_store_from_env() if window_seconds > 0 else None
+            )
+        return _deduplicator
+
+def set_deduplicator(deduplicator):
+    """Replace the process-wide deduplicator, e.g. with a shorter window for tests"""
+    global _deduplicator
+    with _deduplicator_lock:
+        _deduplicator = deduplicator
@@ -4,6 +4,8 @@ import logging
 from google.cloud import securitycenter
 from google.cloud import pubsub_v1
 
+from idempotency import get_ledger
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -40,6 +42,13 @@ def process_finding(cloud_event):
             logger.info(f"Skipping non-active finding: {finding_name}")
             return
         
+        # Skip findings this message already handled on an earlier delivery
+        message_id = cloud_event.data['message'].get('messageId')
+        resource_name = finding_data.get('resourceName', '')
+        ledger = get_ledger()
+        if ledger.lookup(message_id, resource_name, category) is not None:
+            return
+        
         # Route to appropriate remediation handler
         if category == 'OPEN_FIREWALL':
             remediate_open_firewall(finding_data)
@@ -54,6 +63,7 @@ def process_finding(cloud_event):
             
         # Update finding state to indicate processing
         update_finding_state(finding_name, 'INACTIVE', 'Automated remediation applied')
+        ledger.record(message_id, resource_name, category, {'finding_name': finding_name, 'state': 'INACTIVE'})
         
     except Exception as e:
         logger.error(f"Error processing finding: {str(e)}")
@@ -0,0 +1,340 @@
+"""
+Finding Worker
+Long-running alternative to the per-finding remediation function: pulls SCC
+findings over a streaming pull in micro-batches, remediates each resource in
+one pass per batch with the remediation function's remediators, most severe
+first, and acknowledges each batch together
+"""
+
+import json
+import os
+import signal
+import threading
+import time
+import logging
+from collections import deque
+from google.cloud import pubsub_v1
+
+from audit_sink import get_audit_sink
+from clients import get_client
+from idempotency import get_ledger
+from finding_dedup import get_deduplicator
+from remediation_function import apply_remediation, complete_remediation, remediation_handler
+from remediation_scheduler import SEVERITY_PRIORITIES, RemediationScheduler, finding_priority, scheduler_from_env
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class FindingBatcher:
+    """
+    Buffer between the subscriber's callback threads and the batch loop
+
+    A batch is released once max_batch_size messages are waiting or the
+    oldest has waited max_wait_seconds. After close() the remaining messages
+    are released and then empty batches are returned.
+    """
+
+    def __init__(self, max_batch_size=100, max_wait_seconds=2.0):
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self._messages = deque()
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def add(self, message):
+        """Subscriber callback: queue a received message"""
+        with self._condition:
+            self._messages.append((time.monotonic(), message))
+            # The first message starts the wait timer; a full batch ends it
+            if len(self._messages) == 1 or len(self._messages) >= self.max_batch_size:
+                self._condition.notify()
+
+    def depth(self):
+        """Return the number of received messages waiting for a batch"""
+        with self._condition:
+            return len(self._messages)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def next_batch(self):
+        """Block until a batch is due and return its messages, or [] once closed and drained"""
+        with self._condition:
+            while not self._closed and len(self._messages) < self.max_batch_size:
+                if self._messages:
+                    remaining = self._messages[0][0] + self.max_wait_seconds - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                else:
+                    self._condition.wait()
+
+            count = min(len(self._messages), self.max_batch_size)
+            return [self._messages.popleft()[1] for _ in range(count)]
+
+def group_findings(entries):
+    """
+    Group (message, finding) entries by resource name, in order of first
+    appearance, so every category of a resource is remediated in one pass
+    """
+    groups = {}
+    for message, finding_data in entries:
+        groups.setdefault(finding_data.get('resourceName', ''), []).append((message, finding_data))
+    return list(groups.items())
+
+def publish_latency(message, now):
+    """Return seconds from publishing a message to now, or None without a publish time"""
+    publish_time = getattr(message, 'publish_time', None)
+    if publish_time is None:
+        return None
+    return max(0.0, now - publish_time.timestamp())
+
+def most_severe(findings):
+    """Return the most severe severity among findings"""
+    return min(
+        ((finding_data.get('severity') or 'LOW').upper() for finding_data in findings),
+        key=lambda severity: SEVERITY_PRIORITIES.get(severity, len(SEVERITY_PRIORITIES))
+    )
+
+class _Batch:
+    """Messages of one pulled batch, acked together once every group has finished"""
+
+    def __init__(self, size, groups, nacks):
+        self.size = size
+        self.groups = groups
+        self.remaining = groups
+        self.acks = []
+        self.nacks = list(nacks)
+        self.remediations = 0
+        self.recorded = 0
+        self.suppressed = 0
+        self.merged = 0
+        self.shed = 0
+        self.started = time.monotonic()
+
+class FindingWorker:
+    """
+    Streaming pull consumer that remediates findings in micro-batches
+
+    The findings of a resource in a batch are remediated in one pass, which
+    the scheduler runs in order of severity: categories remediated within
+    the dedup window are absorbed, and categories sharing a remediator share
+    one call. Every finding is still audited, resolved and recorded in the
+    idempotency ledger as the per-finding function does. Flow control bounds the messages held between
+    pull and ack. Messages are acked once their whole batch is done, so the
+    client sends the acks together; groups that raise or are shed are nacked
+    for redelivery.
+    """
+
+    def __init__(self, subscription_path, project_id, batcher=None, scheduler=None, max_outstanding=1000):
+        self.subscription_path = subscription_path
+        self.project_id = project_id
+        self.batcher = batcher or FindingBatcher()
+        self.scheduler = scheduler or RemediationScheduler()
+        self.flow_control = pubsub_v1.types.FlowControl(max_messages=max_outstanding)
+        self.stats = {
+            'batches': 0, 'messages': 0, 'remediations': 0, 'recorded': 0,
+            'suppressed': 0, 'merged': 0, 'acked': 0, 'nacked': 0
+        }
+        self._streaming_pull = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Open the streaming pull; messages are buffered until run() batches them"""
+        self._streaming_pull = get_client('pubsub.subscriber').subscribe(
+            self.subscription_path, callback=self.batcher.add, flow_control=self.flow_control
+        )
+        logger.info(f"Pulling findings from {self.subscription_path}")
+
+    def stop(self):
+        """Stop pulling; run() finishes the buffered messages, flushes the audit sink and returns"""
+        if self._streaming_pull is not None:
+            self._streaming_pull.cancel()
+        self.batcher.close()
+
+    def run(self):
+        self.scheduler.start()
+        self.start()
+        while True:
+            batch = self.batcher.next_batch()
+            if not batch:
+                break
+            self.submit_batch(batch)
+        self.scheduler.close(wait=True)
+        self.scheduler.log_latencies()
+        get_deduplicator().log_stats()
+        # Write the audit rows still buffered before the process exits
+        get_audit_sink(self.project_id).close()
+        logger.info(f"Finding worker stopped: {self.stats}, scheduler: {self.scheduler.stats}")
+
+    def submit_batch(self, batch):
+        """Queue one remediation pass per resource of a batch with the scheduler"""
+        entries = []
+        nacks = []
+        for message in batch:
+            try:
+                entries.append((message, json.loads(message.data)))
+            except ValueError as e:
+                logger.error(f"Undecodable finding message {message.message_id}: {str(e)}")
+                nacks.append(message)
+
+        groups = group_findings(entries)
+        state = _Batch(len(batch), len(groups), nacks)
+        if not groups:
+            self.finish_batch(state)
+            return
+
+        for item in groups:
+            _, group = item
+            published = [
+                message.publish_time.timestamp() for message, _ in group
+                if getattr(message, 'publish_time', None) is not None
+            ]
+            severity = most_severe([finding_data for _, finding_data in group])
+            category = min(
+                (finding_data.get('category', '') for _, finding_data in group),
+                key=lambda category: finding_priority(severity, category)
+            )
+            self.scheduler.submit(
+                lambda item=item: self.complete_group(state, item, self.remediate_group(item)),
+                severity,
+                category,
+                on_shed=lambda item=item: self.complete_group(state, item, {'status': 'shed'}),
+                published_at=min(published) if published else None
+            )
+
+    def complete_group(self, state, item, outcome):
+        """Collect the outcome of one group and finish its batch after the last one"""
+        _, group = item
+        messages = [message for message, _ in group]
+        with self._lock:
+            (state.acks if outcome['status'] == 'done' else state.nacks).extend(messages)
+            state.remediations += outcome.get('remediations', 0)
+            state.recorded += outcome.get('recorded', 0)
+            state.suppressed += outcome.get('suppressed', 0)
+            state.merged += outcome.get('merged', 0)
+            state.shed += 1 if outcome['status'] == 'shed' else 0
+            state.remaining -= 1
+            finished = state.remaining == 0
+        if finished:
+            self.finish_batch(state)
+
+    def finish_batch(self, state):
+        """Ack or nack every message of a finished batch and log the batch metrics"""
+        for message in state.acks:
+            message.ack()
+        for message in state.nacks:
+            message.nack()
+
+        now = time.time()
+        latencies = sorted(
+            latency for latency in (publish_latency(message, now) for message in state.acks)
+            if latency is not None
+        )
+        with self._lock:
+            self.stats['batches'] += 1
+            self.stats['messages'] += state.size
+            self.stats['remediations'] += state.remediations
+            self.stats['recorded'] += state.recorded
+            self.stats['suppressed'] += state.suppressed
+            self.stats['merged'] += state.merged
+            self.stats['acked'] += len(state.acks)
+            self.stats['nacked'] += len(state.nacks)
+
+        logger.info(json.dumps({
+            'event': 'finding_batch',
+            'batch_size': state.size,
+            'resources': state.groups,
+            'remediations': state.remediations,
+            'already_recorded': state.recorded,
+            'suppressed': state.suppressed,
+            'merged': state.merged,
+            'shed': state.shed,
+            'acked': len(state.acks),
+            'nacked': len(state.nacks),
+            'queue_depth': self.batcher.depth() + self.scheduler.depth(),
+            'processing_ms': round((time.monotonic() - state.started) * 1000, 3),
+            'latency_p50_ms': round(latencies[len(latencies) // 2] * 1000, 3) if latencies else None,
+            'latency_max_ms': round(latencies[-1] * 1000, 3) if latencies else None
+        }))
+        self.scheduler.log_latencies()
+
+    def remediate_group(self, item):
+        """
+        Remediate the findings of one resource in a single pass and return
+        its status with the remediations run, findings already recorded,
+        findings suppressed by the dedup window and categories merged
+        """
+        resource_name, group = item
+        ledger = get_ledger()
+        deduplicator = get_deduplicator()
+        outcome = {'status': 'done', 'remediations': 0, 'recorded': 0, 'suppressed': 0, 'merged': 0}
+        try:
+            by_category = {}
+            for message, finding_data in group:
+                category = finding_data.get('category', '')
+                if ledger.lookup(message.message_id, resource_name, category) is not None:
+                    outcome['recorded'] += 1
+                    continue
+                by_category.setdefault(category, []).append((message, finding_data))
+
+            scc_client = get_client('securitycenter')
+            results = {}
+            for category, findings in by_category.items():
+                remembered = deduplicator.seen(resource_name, category)
+                if remembered is not None:
+                    logger.info(f"Suppressed {len(findings)} repeat {category} findings for {resource_name}")
+                    for message, _ in findings:
+                        ledger.record(message.message_id, resource_name, category, remembered)
+                    outcome['suppressed'] += len(findings)
+                    continue
+
+                # Categories with the same remediator share its call on this resource
+                remediator = remediation_handler(category)
+                if remediator is not None and remediator in results:
+                    deduplicator.merged(category)
+                    outcome['merged'] += 1
+                else:
+                    logger.info(f"Remediating {category} on {resource_name} for {len(findings)} findings")
+                    results[remediator] = apply_remediation(category, resource_name, findings[0][1], self.project_id)
+                    outcome['remediations'] += 1
+
+                for message, finding_data in findings:
+                    complete_remediation(
+                        scc_client, ledger, message.message_id, finding_data, results[remediator], self.project_id
+                    )
+            return outcome
+
+        except Exception as e:
+            logger.error(f"Error remediating {resource_name}: {str(e)}")
+            return {'status': 'failed'}
+
+def worker_from_env():
+    """Build a worker from FINDING_SUBSCRIPTION and the FINDING_* batching settings"""
+    project_id = os.environ.get('PROJECT_ID')
+    subscription = os.environ['FINDING_SUBSCRIPTION']
+    if '/' not in subscription:
+        subscription = f"projects/{project_id}/subscriptions/{subscription}"
+
+    batcher = FindingBatcher(
+        max_batch_size=int(os.environ.get('FINDING_BATCH_SIZE', '100')),
+        max_wait_seconds=float(os.environ.get('FINDING_BATCH_WAIT_SECONDS', '2'))
+    )
+    return FindingWorker(
+        subscription,
+        project_id,
+        batcher=batcher,
+        scheduler=scheduler_from_env(),
+        max_outstanding=int(os.environ.get('FINDING_MAX_OUTSTANDING', '1000'))
+    )
+
+def main():
+    worker = worker_from_env()
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+    worker.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,602 @@
+"""
+Playbook Engine
+Loads the remediation playbooks (playbooks/*.yaml) once per process, compiles
+their conditions and step graphs, and runs the actions matching a finding with
+independent steps in parallel
+"""
+
+import ast
+import json
+import os
+import threading
+import time
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from clients import get_client
+
+logger = logging.getLogger(__name__)
+
+class PlaybookError(ValueError):
+    """A playbook that cannot be compiled"""
+
+# Comparisons a condition may use
+COMPARISONS = {
+    ast.Eq: lambda left, right: left == right,
+    ast.NotEq: lambda left, right: left != right,
+    ast.In: lambda left, right: left in right,
+    ast.NotIn: lambda left, right: left not in right,
+    ast.Lt: lambda left, right: left < right,
+    ast.LtE: lambda left, right: left <= right,
+    ast.Gt: lambda left, right: left > right,
+    ast.GtE: lambda left, right: left >= right
+}
+
+def compile_condition(expression):
+    """
+    Compile a condition to a function of (finding, flags)
+
+    Conditions are Python expressions limited to literals, comparisons,
+    and/or/not, attribute paths on finding (finding.category reads the
+    finding's 'category' field) and bare names, which read flags. Anything
+    else is rejected here, so events never evaluate arbitrary code.
+    """
+    try:
+        tree = ast.parse(str(expression).strip(), mode='eval')
+    except SyntaxError as e:
+        raise PlaybookError(f"Invalid condition {expression!r}: {e.msg}")
+    return _compile_node(tree.body, expression)
+
+def _compile_node(node, expression):
+    if isinstance(node, ast.Constant):
+        value = node.value
+        return lambda finding, flags: value
+
+    if isinstance(node, (ast.List, ast.Tuple)):
+        items = [_compile_node(item, expression) for item in node.elts]
+        return lambda finding, flags: tuple(item(finding, flags) for item in items)
+
+    if isinstance(node, ast.Name):
+        name = node.id
+        if name == 'finding':
+            return lambda finding, flags: finding
+        return lambda finding, flags: flags.get(name, False)
+
+    if isinstance(node, ast.Attribute):
+        path = finding_path(node)
+        if path is None:
+            raise PlaybookError(f"Only finding fields can be read in {expression!r}")
+
+        def read(finding, flags):
+            value = finding
+            for key in path:
+                if not isinstance(value, dict):
+                    return None
+                value = value.get(key)
+            return value
+        return read
+
+    if isinstance(node, ast.BoolOp):
+        operands = [_compile_node(value, expression) for value in node.values]
+        if isinstance(node.op, ast.And):
+            return lambda finding, flags: all(operand(finding, flags) for operand in operands)
+        return lambda finding, flags: any(operand(finding, flags) for operand in operands)
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        operand = _compile_node(node.operand, expression)
+        return lambda finding, flags: not operand(finding, flags)
+
+    if isinstance(node, ast.Compare):
+        terms = [_compile_node(node.left, expression)] + [
+            _compile_node(comparator, expression) for comparator in node.comparators
+        ]
+        operators = []
+        for operator in node.ops:
+            if type(operator) not in COMPARISONS:
+                raise PlaybookError(f"Unsupported comparison in {expression!r}")
+            operators.append(COMPARISONS[type(operator)])
+
+        def compare(finding, flags):
+            left = terms[0](finding, flags)
+            for operator, term in zip(operators, terms[1:]):
+                right = term(finding, flags)
+                try:
+                    if not operator(left, right):
+                        return False
+                except TypeError:
+                    return False
+                left = right
+            return True
+        return compare
+
+    raise PlaybookError(f"Unsupported expression {type(node).__name__} in {expression!r}")
+
+def finding_path(node):
+    """Return the field path of a finding.a.b attribute node, or None"""
+    path = []
+    while isinstance(node, ast.Attribute):
+        path.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name) and node.id == 'finding':
+        return tuple(reversed(path))
+    return None
+
+def condition_categories(expression):
+    """
+    Return the categories a condition can only match, from finding.category
+    == 'X' or finding.category in [...] comparisons joined by or, or None
+    """
+    def categories(node):
+        if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.Or):
+            found = [categories(value) for value in node.values]
+            return None if None in found else set().union(*found)
+        if isinstance(node, ast.Compare) and len(node.ops) == 1:
+            if finding_path(node.left) != ('category',):
+                return None
+            comparator = node.comparators[0]
+            if isinstance(node.ops[0], ast.Eq) and isinstance(comparator, ast.Constant):
+                return {comparator.value}
+            if isinstance(node.ops[0], ast.In) and isinstance(comparator, (ast.List, ast.Tuple)) \
+                    and all(isinstance(item, ast.Constant) for item in comparator.elts):
+                return {item.value for item in comparator.elts}
+        if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+            # Every operand must hold, so any operand that pins the category is enough
+            for value in node.values:
+                found = categories(value)
+                if found is not None:
+                    return found
+        return None
+
+    return categories(ast.parse(str(expression).strip(), mode='eval').body)
+
+def instance_location(resource_name):
+    """Return (zone, instance) from a compute instance resource name"""
+    parts = resource_name.split('/')
+    return parts[-3], parts[-1]
+
+def set_instance_metadata(compute_client, project_id, zone, instance_name, key, value):
+    """Set one metadata item on an instance, keeping the other items and the fingerprint"""
+    from google.cloud import compute_v1
+
+    instance = compute_client.get(project=project_id, zone=zone, instance=instance_name)
+    metadata = instance.metadata
+    for item in metadata.items:
+        if item.key == key:
+            if item.value == value:
+                return False
+            item.value = value
+            break
+    else:
+        metadata.items.append(compute_v1.Items(key=key, value=value))
+
+    compute_client.set_metadata(
+        project=project_id, zone=zone, instance=instance_name, metadata_resource=metadata
+    ).result()
+    return True
+
+def update_shielded_vm_config(compute_client, project_id, zone, instance_name, features):
+    """Turn on the Shielded VM features listed (secure_boot, vtpm, integrity_monitoring)"""
+    from google.cloud import compute_v1
+
+    config = compute_v1.ShieldedInstanceConfig(
+        enable_secure_boot='secure_boot' in features,
+        enable_vtpm='vtpm' in features,
+        enable_integrity_monitoring='integrity_monitoring' in features
+    )
+    compute_client.update_shielded_instance_config(
+        project=project_id, zone=zone, instance=instance_name,
+        shielded_instance_config_resource=config
+    ).result()
+
+class StepContext:
+    """The finding a playbook action runs for, shared by its steps"""
+
+    def __init__(self, resource_name, finding_data, project_id):
+        self.resource_name = resource_name
+        self.finding_data = finding_data
+        self.project_id = project_id
+
+    def instance(self):
+        """Return (compute client, project, zone, instance) for an instance finding"""
+        zone, instance_name = instance_location(self.resource_name)
+        return get_client('compute.instances'), self.project_id, zone, instance_name
+
+    def bucket(self):
+        return get_client('storage').bucket(self.resource_name.split('/')[-1])
+
+# Step statuses after which dependent steps run
+PASSED = ('succeeded', 'not_required')
+
+# Step handlers take the context and the step's parameters and return a result
+# dict; a truthy 'required' in a result sets the 'required' flag for dependents
+
+def step_set_metadata(context, params):
+    changed = set_instance_metadata(*context.instance(), params['key'], str(params['value']))
+    # OS Login and most metadata keys are picked up without a restart
+    return {'success': True, 'changed': changed}
+
+def step_stop_instance(context, params):
+    compute_client, project_id, zone, instance_name = context.instance()
+    compute_client.stop(project=project_id, zone=zone, instance=instance_name).result()
+    return {'success': True}
+
+def step_start_instance(context, params):
+    compute_client, project_id, zone, instance_name = context.instance()
+    compute_client.start(project=project_id, zone=zone, instance=instance_name).result()
+    return {'success': True}
+
+def step_restart_instance(context, params):
+    compute_client, project_id, zone, instance_name = context.instance()
+    compute_client.reset(project=project_id, zone=zone, instance=instance_name).result()
+    return {'success': True}
+
+def step_enable_shielded_vm_config(context, params):
+    features = params.get('features') or ['secure_boot', 'vtpm', 'integrity_monitoring']
+    update_shielded_vm_config(*context.instance(), features)
+    return {'success': True, 'features': list(features)}
+
+def step_backup_iam_policy(context, params):
+    policy = context.bucket().get_iam_policy(requested_policy_version=3)
+    return {'success': True, 'bindings': [
+        {'role': binding['role'], 'members': sorted(binding['members'])} for binding in policy.bindings
+    ]}
+
+def step_enable_uniform_bucket_level_access(context, params):
+    bucket = context.bucket()
+    bucket.reload()
+    if bucket.iam_configuration.uniform_bucket_level_access_enabled:
+        return {'success': True, 'changed': False}
+    bucket.iam_configuration.uniform_bucket_level_access_enabled = True
+    bucket.patch()
+    return {'success': True, 'changed': True}
+
+def step_enable_object_versioning(context, params):
+    bucket = context.bucket()
+    bucket.versioning_enabled = True
+    bucket.patch()
+    return {'success': True}
+
+def step_configure_version_lifecycle(context, params):
+    # Delete noncurrent versions once enough newer ones exist, keeping the other rules
+    keep_versions = int(params.get('keep_versions', 3))
+    bucket = context.bucket()
+    bucket.reload()
+    for rule in bucket.lifecycle_rules:
+        if (rule.get('action', {}).get('type') == 'Delete'
+                and rule.get('condition', {}).get('numNewerVersions') == keep_versions):
+            return {'success': True, 'changed': False}
+    bucket.add_lifecycle_delete_rule(number_of_newer_versions=keep_versions)
+    bucket.patch()
+    return {'success': True, 'changed': True, 'keep_versions': keep_versions}
+
+def remove_bucket_member(context, member):
+    bucket = context.bucket()
+    policy = bucket.get_iam_policy(requested_policy_version=3)
+    removed = []
+    for binding in policy.bindings:
+        if member in binding['members']:
+            binding['members'].discard(member)
+            removed.append(binding['role'])
+    if removed:
+        bucket.set_iam_policy(policy)
+    return {'success': True, 'removed_roles': removed}
+
+def step_remove_all_users(context, params):
+    return remove_bucket_member(context, 'allUsers')
+
+def step_remove_all_authenticated_users(context, params):
+    return remove_bucket_member(context, 'allAuthenticatedUsers')
+
+STEP_HANDLERS = {
+    'set_metadata': step_set_metadata,
+    'stop_instance': step_stop_instance,
+    'start_instance': step_start_instance,
+    'restart_instance': step_restart_instance,
+    'enable_shielded_vm_config': step_enable_shielded_vm_config,
+    'backup_iam_policy': step_backup_iam_policy,
+    'enable_uniform_bucket_level_access': step_enable_uniform_bucket_level_access,
+    'enable_object_versioning': step_enable_object_versioning,
+    'configure_version_lifecycle': step_configure_version_lifecycle,
+    'remove_allUsers_permissions': step_remove_all_users,
+    'remove_allAuthenticatedUsers_permissions': step_remove_all_authenticated_users
+}
+
+class _Step:
+    __slots__ = ('position', 'action', 'params', 'condition', 'after', 'always', 'handler')
+
+    def __init__(self, position, action, params, condition, after, always, handler):
+        self.position = position
+        self.action = action
+        self.params = params
+        self.condition = condition
+        self.after = after
+        self.always = always
+        self.handler = handler
+
+class PlaybookAction:
+    """One compiled playbook action: its condition and its step graph"""
+
+    def __init__(self, playbook, definition, handlers):
+        self.playbook = playbook
+        self.name = definition.get('name', '')
+        self.expression = definition.get('condition')
+        self.condition = compile_condition(self.expression) if self.expression else None
+        self.categories = condition_categories(self.expression) if self.expression else None
+        self.steps = self._compile_steps(definition.get('steps') or [], handlers)
+        self.unsupported = sorted({step.action for step in self.steps if step.handler is None})
+
+    def _compile_steps(self, definitions, handlers):
+        """
+        Compile steps in file order. A step runs after the steps named in its
+        'after' list, or after the previous step when it has none; 'after: []'
+        lets it start with the first step. A step with 'always: true' runs
+        even if a step it follows failed, e.g. to start a stopped instance.
+        """
+        steps = []
+        positions = {}
+        for position, definition in enumerate(definitions):
+            action = definition.get('action')
+            if not action:
+                raise PlaybookError(f"Step {position} of {self.playbook}/{self.name} has no action")
+
+            if 'after' in definition:
+                after = []
+                for name in definition['after'] or []:
+                    if name not in positions:
+                        raise PlaybookError(
+                            f"Step {action} of {self.playbook}/{self.name} runs after unknown or later step {name}"
+                        )
+                    after.append(positions[name])
+            else:
+                after = [position - 1] if position else []
+
+            condition = definition.get('condition')
+            params = {
+                key: value for key, value in definition.items()
+                if key not in ('action', 'after', 'always', 'condition')
+            }
+            steps.append(_Step(
+                position, action, params,
+                compile_condition(condition) if condition is not None else None,
+                tuple(after), bool(definition.get('always')), handlers.get(action)
+            ))
+            positions[action] = position
+        return steps
+
+    def matches(self, finding_data):
+        return self.condition is None or bool(self.condition(finding_data, {}))
+
+class PlaybookEngine:
+    """
+    Compiled playbooks indexed by finding category
+
+    An action is indexed under the categories its condition pins
+    (finding.category == 'X'), and every action of a playbook under the
+    playbook's trigger categories; the conditions of the indexed actions are
+    still checked per finding. Steps run on a shared pool of
+    max_parallel_steps threads as soon as the steps they follow succeed.
+    A step whose dependency failed is skipped, which fails the action; a
+    step whose condition is false is not_required and does not.
+    """
+
+    def __init__(self, playbooks, handlers=None, max_parallel_steps=4):
+        self.handlers = dict(STEP_HANDLERS if handlers is None else handlers)
+        self.actions = []
+        self.triggers = {}
+        for name, definition in playbooks:
+            try:
+                self._index(name, definition or {})
+            except (PlaybookError, AttributeError, TypeError, SyntaxError) as e:
+                logger.error(f"Skipping playbook {name}: {str(e)}")
+        self.max_parallel_steps = max_parallel_steps
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _index(self, name, definition):
+        """Compile every action of a playbook, then index them; a playbook that fails to compile adds nothing"""
+        if not isinstance(definition, dict):
+            raise PlaybookError("Playbook is not a mapping")
+        trigger_categories = [
+            trigger['category'] for trigger in definition.get('triggers') or [] if trigger.get('category')
+        ]
+        actions = [
+            PlaybookAction(name, action_definition, self.handlers)
+            for action_definition in definition.get('actions') or []
+        ]
+        for action in actions:
+            self.actions.append(action)
+            categories = set(trigger_categories)
+            categories.update(action.categories or ())
+            for category in categories:
+                entries = self.triggers.setdefault(category, [])
+                if action not in entries:
+                    entries.append(action)
+            if action.unsupported:
+                logger.debug(f"Playbook action {name}/{action.name} has no handler for {', '.join(action.unsupported)}")
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_parallel_steps, thread_name_prefix='playbook-step'
+                )
+            return self._executor
+
+    def indexed(self, category):
+        """Return True if any playbook action is indexed under category"""
+        return category in self.triggers
+
+    def match(self, finding_data):
+        """Return the actions indexed under the finding's category whose condition holds"""
+        return [
+            action for action in self.triggers.get(finding_data.get('category', ''), ())
+            if action.matches(finding_data)
+        ]
+
+    def remediate(self, resource_name, finding_data, project_id):
+        """
+        Run the matching actions that have a handler for every step, in file
+        order, and return a remediation result, or None if none can run
+        """
+        runnable = [action for action in self.match(finding_data) if not action.unsupported]
+        if not runnable:
+            return None
+
+        context = StepContext(resource_name, finding_data, project_id)
+        results = [self.run(action, context) for action in runnable]
+        return {
+            'success': all(result['success'] for result in results),
+            'actions': [
+                step['action'] for result in results for step in result['steps'] if step['status'] == 'succeeded'
+            ],
+            'resource': resource_name,
+            'playbooks': [
+                {'playbook': result['playbook'], 'action': result['action'], 'success': result['success']}
+                for result in results
+            ]
+        }
+
+    def run(self, action, context):
+        """Run the steps of one action, independent ones in parallel, and log their timings"""
+        started = time.perf_counter()
+        outcomes = {}
+        pending = {}
+        waiting = list(action.steps)
+
+        while waiting or pending:
+            ready = [step for step in waiting if all(position in outcomes for position in step.after)]
+            for step in ready:
+                waiting.remove(step)
+                blocked = [position for position in step.after if outcomes[position]['status'] not in PASSED]
+                if blocked and not step.always:
+                    outcomes[step.position] = {'action': step.action, 'status': 'skipped', 'duration_ms': 0.0}
+                    continue
+                flags = {}
+                for position in step.after:
+                    flags.update(outcomes[position].get('flags', {}))
+                if step.condition is not None and not step.condition(context.finding_data, flags):
+                    # A step whose condition is false does not block the steps after it
+                    outcomes[step.position] = {'action': step.action, 'status': 'not_required',
+                                               'duration_ms': 0.0, 'flags': flags}
+                    continue
+                pending[self.executor.submit(self._run_step, step, context)] = step
+
+            if ready and not pending:
+                # Steps resolved without running may have released others
+                continue
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = pending.pop(future)
+                outcomes[step.position] = future.result()
+
+        steps = [outcomes[step.position] for step in action.steps if step.position in outcomes]
+        success = all(step['status'] in PASSED for step in steps)
+        logger.info(json.dumps({
+            'event': 'playbook_run',
+            'playbook': action.playbook,
+            'action': action.name,
+            'resource': context.resource_name,
+            'success': success,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+            'steps': [
+                {key: value for key, value in step.items() if key in ('action', 'status', 'duration_ms', 'error')}
+                for step in steps
+            ]
+        }))
+        return {
+            'playbook': action.playbook,
+            'action': action.name,
+            'success': success,
+            'steps': [{key: value for key, value in step.items() if key != 'flags'} for step in steps]
+        }
+
+    def _run_step(self, step, context):
+        started = time.perf_counter()
+        try:
+            result = step.handler(context, step.params) or {}
+            status = 'succeeded' if result.get('success', True) else 'failed'
+            outcome = {'action': step.action, 'status': status, 'result': result}
+            if result.get('required'):
+                outcome['flags'] = {'required': True}
+            if status == 'failed':
+                outcome['error'] = result.get('error')
+        except Exception as e:
+            logger.error(f"Playbook step {step.action} failed on {context.resource_name}: {str(e)}")
+            outcome = {'action': step.action, 'status': 'failed', 'error': str(e)}
+        outcome['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        return outcome
+
+def read_file(path):
+    with open(path) as source:
+        return source.read()
+
+def load_playbooks(directory=None, bucket_name=None):
+    """
+    Return (name, definition) for every playbook, read from bucket_name in
+    Cloud Storage if given, otherwise from *.yaml files in directory;
+    playbooks that cannot be read or parsed are logged and skipped
+    """
+    # Imported here so the remediation function still loads without PyYAML
+    import yaml
+
+    sources = []
+    if bucket_name:
+        for blob in get_client('storage').list_blobs(bucket_name):
+            if blob.name.endswith(('.yaml', '.yml')):
+                sources.append((blob.name, blob.download_as_text))
+    else:
+        directory = directory or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'playbooks')
+        for file_name in sorted(os.listdir(directory)):
+            if file_name.endswith(('.yaml', '.yml')):
+                path = os.path.join(directory, file_name)
+                sources.append((file_name, lambda path=path: read_file(path)))
+
+    playbooks = []
+    for name, read in sources:
+        try:
+            playbooks.append((name, yaml.safe_load(read())))
+        except Exception as e:
+            logger.error(f"Skipping playbook {name}: {str(e)}")
+    return playbooks
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_playbook_engine():
+    """
+    Return the process-wide engine, loading and compiling the playbooks on
+    first use. If they cannot be loaded at all (no PyYAML, or the bucket
+    cannot be listed) an empty engine is cached, so every category falls back
+    to its built-in remediator instead of retrying the load per finding.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            started = time.perf_counter()
+            try:
+                playbooks = load_playbooks(
+                    directory=os.environ.get('PLAYBOOK_DIR'),
+                    bucket_name=os.environ.get('PLAYBOOK_BUCKET')
+                )
+            except Exception as e:
+                logger.error(f"Failed to load playbooks, using built-in remediators only: {str(e)}")
+                playbooks = []
+            _engine = PlaybookEngine(
+                playbooks,
+                max_parallel_steps=int(os.environ.get('PLAYBOOK_MAX_PARALLEL_STEPS', '4'))
+            )
+            logger.info(
+                f"Compiled {len(_engine.actions)} playbook actions for {len(_engine.triggers)} categories "
+                f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+            )
+        return _engine
+
+def set_playbook_engine(engine):
+    """Replace the process-wide engine, e.g. with one built from test playbooks"""
+    global _engine
+    with _engine_lock:
+        _engine = engine
@@ -1,11 +1,15 @@
 import json
 import base64
 import logging
-from google.cloud import securitycenter
-from google.cloud import compute_v1
-from google.cloud import storage
-from google.cloud import bigquery
 import os
+from functools import lru_cache
+from datetime import datetime, timezone
+
+from audit_sink import get_audit_sink
+from clients import get_client
+from idempotency import get_ledger
+from finding_dedup import get_deduplicator
+from playbook_engine import get_playbook_engine, set_instance_metadata, update_shielded_vm_config
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,11 +22,14 @@ def remediate_finding(cloud_event):
     pubsub_message = base64.b64decode(cloud_event.data['message']['data']).decode('utf-8')
     finding_data = json.loads(pubsub_message)
     
+    message_id = cloud_event.data['message'].get('messageId')
+    
     project_id = os.environ.get('PROJECT_ID')
     org_id = os.environ.get('ORG_ID')
     
-    # Initialize clients
-    scc_client = securitycenter.SecurityCenterClient()
+    # Shared clients are reused across warm invocations
+    scc_client = get_client('securitycenter')
+    ledger = get_ledger()
     
     try:
         # Parse finding information
@@ -33,20 +40,26 @@ def remediate_finding(cloud_event):
         
         logger.info(f"Processing finding: {finding_name}")
         
+        # A redelivered message returns the outcome recorded on its first delivery
+        recorded = ledger.lookup(message_id, resource_name, category)
+        if recorded is not None:
+            return {'status': 'success', 'action': recorded}
+        
+        # A repeat of a finding remediated within the dedup window is absorbed
+        deduplicator = get_deduplicator()
+        remembered = deduplicator.seen(resource_name, category)
+        if remembered is not None:
+            logger.info(f"Suppressed repeat {category} finding for {resource_name}")
+            ledger.record(message_id, resource_name, category, remembered)
+            deduplicator.log_stats()
+            return {'status': 'success', 'action': remembered}
+        
         # Apply remediation based on finding category
         remediation_result = apply_remediation(
             category, resource_name, finding_data, project_id
         )
         
-        # Log remediation action
-        log_remediation_action(
-            finding_name, resource_name, category, 
-            remediation_result, project_id
-        )
-        
-        # Update finding status
-        if remediation_result['success']:
-            update_finding_status(scc_client, finding_name, 'RESOLVED')
+        complete_remediation(scc_client, ledger, message_id, finding_data, remediation_result, project_id)
         
         return {'status': 'success', 'action': remediation_result}
         
@@ -57,24 +70,82 @@ def remediate_finding(cloud_event):
             {'success': False, 'error': str(e)}, project_id
         )
         return {'status': 'error', 'message': str(e)}
+    finally:
+        # CPU is throttled once the invocation returns, so park this event's
+        # audit rows in the local spool for the flusher or the next invocation
+        get_audit_sink(project_id).spool_pending()
+
+def complete_remediation(scc_client, ledger, message_id, finding_data, remediation_result, project_id):
+    """
+    Audit a finding's remediation, then resolve the finding and record the
+    outcome for redeliveries and the dedup window if it succeeded
+    """
+    finding_name = finding_data.get('name', '')
+    category = finding_data.get('category', '')
+    resource_name = finding_data.get('resourceName', '')
+    
+    # Log remediation action
+    log_remediation_action(
+        finding_name, resource_name, category,
+        remediation_result, project_id
+    )
+    
+    # Update finding status
+    if remediation_result['success']:
+        update_finding_status(scc_client, finding_name, 'RESOLVED')
+        ledger.record(message_id, resource_name, category, remediation_result)
+        get_deduplicator().remember(resource_name, category, remediation_result)
 
 def apply_remediation(category, resource_name, finding_data, project_id):
     """Apply specific remediation based on finding category"""
     
+    remediator = remediation_handler(category)
+    if remediator is None:
+        return {'success': False, 'action': 'no_remediation_available'}
+    return remediator(resource_name, finding_data, project_id)
+
+def remediation_handler(category):
+    """Return the remediator for a finding category, or None if there is none"""
+    
+    if get_playbook_engine().indexed(category):
+        return playbook_remediator(category)
+    return category_remediator(category)
+
+@lru_cache(maxsize=None)
+def playbook_remediator(category):
+    """
+    Return the remediator for a category with playbook actions, one per
+    category so the worker never merges two categories' playbooks; it falls
+    back to the category's built-in remediator when no action can run
+    """
+    fallback = category_remediator(category)
+    
+    def remediate_with_playbook(resource_name, finding_data, project_id):
+        result = get_playbook_engine().remediate(resource_name, finding_data, project_id)
+        if result is not None:
+            return result
+        if fallback is None:
+            return {'success': False, 'action': 'no_remediation_available'}
+        return fallback(resource_name, finding_data, project_id)
+    
+    return remediate_with_playbook
+
+def category_remediator(category):
+    """Return the built-in remediator for a finding category, or None if there is none"""
+    
     if 'COMPUTE' in category.upper():
-        return remediate_compute_finding(resource_name, finding_data, project_id)
+        return remediate_compute_finding
     elif 'STORAGE' in category.upper():
-        return remediate_storage_finding(resource_name, finding_data, project_id)
+        return remediate_storage_finding
     elif 'IAM' in category.upper():
-        return remediate_iam_finding(resource_name, finding_data, project_id)
-    else:
-        return {'success': False, 'action': 'no_remediation_available'}
+        return remediate_iam_finding
+    return None
 
 def remediate_compute_finding(resource_name, finding_data, project_id):
     """Remediate compute-related security findings"""
     
     try:
-        compute_client = compute_v1.InstancesClient()
+        compute_client = get_client('compute.instances')
         
         # Extract instance details from resource name
         parts = resource_name.split('/')
@@ -113,7 +184,7 @@ def remediate_storage_finding(resource_name, finding_data, project_id):
     """Remediate storage-related security findings"""
     
     try:
-        storage_client = storage.Client(project=project_id)
+        storage_client = get_client('storage')
         
         # Extract bucket name from resource name
         bucket_name = resource_name.split('/')[-1]
@@ -170,37 +241,39 @@ def has_os_login_enabled(instance):
 
 def enable_os_login(compute_client, project_id, zone, instance_name):
     """Enable OS Login on compute instance"""
-    # Implementation would go here
-    pass
+    set_instance_metadata(compute_client, project_id, zone, instance_name, 'enable-oslogin', 'TRUE')
 
 def has_shielded_vm_enabled(instance):
     """Check if Shielded VM is enabled"""
     return instance.shielded_instance_config is not None
 
 def enable_shielded_vm(compute_client, project_id, zone, instance_name):
-    """Enable Shielded VM features"""
-    # Implementation would go here
-    pass
+    """Enable Shielded VM features, stopping a running instance while they are changed"""
+    instance = compute_client.get(project=project_id, zone=zone, instance=instance_name)
+    running = instance.status == 'RUNNING'
+    if running:
+        compute_client.stop(project=project_id, zone=zone, instance=instance_name).result()
+    try:
+        update_shielded_vm_config(
+            compute_client, project_id, zone, instance_name,
+            ['secure_boot', 'vtpm', 'integrity_monitoring']
+        )
+    finally:
+        if running:
+            compute_client.start(project=project_id, zone=zone, instance=instance_name).result()
 
 def log_remediation_action(finding_id, resource_name, action, result, project_id):
-    """Log remediation action to BigQuery"""
+    """Queue a remediation audit row; the audit sink writes it to BigQuery in the background"""
     
     try:
-        client = bigquery.Client(project=project_id)
-        table_id = f"{project_id}.scc_remediation_audit.remediation_log"
-        
-        rows_to_insert = [{
-            'timestamp': bigquery.ScalarQueryParameter(None, 'TIMESTAMP', None),
+        get_audit_sink(project_id).write({
+            'timestamp': datetime.now(timezone.utc).isoformat(),
             'finding_id': finding_id,
             'resource_name': resource_name,
             'remediation_action': action,
             'status': 'SUCCESS' if result.get('success') else 'FAILED',
             'details': json.dumps(result)
-        }]
-        
-        errors = client.insert_rows_json(table_id, rows_to_insert)
-        if errors:
-            logger.error(f"Error inserting audit log: {errors}")
+        })
             
     except Exception as e:
         logger.error(f"Error logging remediation action: {str(e)}")
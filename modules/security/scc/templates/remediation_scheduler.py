@@ -0,0 +1,329 @@
+"""
+Remediation Scheduler
+Runs queued SCC remediations highest priority first, with a concurrency
+budget per priority, aging so low priorities are not starved, and deferral
+of low-priority work while an API's rate budget runs low
+"""
+
+import json
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Priority levels, most urgent first
+PRIORITIES = ('critical', 'high', 'medium', 'low')
+
+SEVERITY_PRIORITIES = {
+    'CRITICAL': 0,
+    'HIGH': 1,
+    'MEDIUM': 2,
+    'LOW': 3
+}
+
+# Categories that expose resources to the internet are raised one level
+URGENT_CATEGORIES = frozenset([
+    'OPEN_FIREWALL',
+    'OPEN_SSH_PORT',
+    'OPEN_RDP_PORT',
+    'PUBLIC_BUCKET_ACL',
+    'PUBLIC_SQL_INSTANCE',
+    'PUBLIC_IP_ADDRESS',
+    'ADMIN_SERVICE_ACCOUNT'
+])
+
+# Remediations that may run at once per priority
+DEFAULT_BUDGETS = {'critical': 8, 'high': 4, 'medium': 2, 'low': 1}
+
+# Remediations per second (rate, burst) each service may start
+DEFAULT_RATE_LIMITS = {
+    'compute': (10.0, 20),
+    'storage': (20.0, 40),
+    'iam': (5.0, 10)
+}
+
+def finding_priority(severity, category):
+    """Return the priority level (0 is most urgent) for a finding's severity and category"""
+    level = SEVERITY_PRIORITIES.get((severity or '').upper(), len(PRIORITIES) - 1)
+    if (category or '').upper() in URGENT_CATEGORIES:
+        level = max(0, level - 1)
+    return level
+
+def remediation_service(category):
+    """Return the API a category's remediation calls, matching apply_remediation's dispatch"""
+    category = (category or '').upper()
+    if 'COMPUTE' in category:
+        return 'compute'
+    elif 'STORAGE' in category:
+        return 'storage'
+    elif 'IAM' in category:
+        return 'iam'
+    return None
+
+class TokenBucket:
+    """Non-blocking token bucket; the scheduler skips work whose bucket is empty"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def fill(self):
+        """Return the fraction of the bucket that is available"""
+        self._refill()
+        return self.tokens / self.capacity
+
+    def try_acquire(self):
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_seconds(self):
+        """Return the seconds until a token is available"""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+class _Task:
+    __slots__ = ('level', 'severity', 'service', 'run', 'on_shed', 'published_at', 'queued_at', 'sequence')
+
+    def __init__(self, level, severity, service, run, on_shed, published_at, sequence):
+        self.level = level
+        self.severity = severity
+        self.service = service
+        self.run = run
+        self.on_shed = on_shed
+        self.published_at = published_at
+        self.queued_at = time.monotonic()
+        self.sequence = sequence
+
+class RemediationScheduler:
+    """
+    Priority queues in front of the remediation handlers
+
+    Each worker thread takes the most urgent task whose priority is under its
+    concurrency budget and whose service has a token. A task that has waited
+    starvation_seconds is taken before any younger task, whatever its
+    priority. While a service's bucket is below shed_below of capacity,
+    tasks at shed_level or lower priority for it are deferred; deferred
+    tasks that wait max_defer_seconds, or beyond max_deferred of them, are
+    shed through their on_shed callback. Time to remediate, from publish to
+    completion, is recorded per severity.
+    """
+
+    def __init__(self, budgets=None, rate_limits=None, starvation_seconds=60, shed_level=2,
+                 shed_below=0.25, max_defer_seconds=300, max_deferred=500):
+        budgets = budgets or DEFAULT_BUDGETS
+        self.budgets = [budgets.get(priority, 1) for priority in PRIORITIES]
+        self.buckets = {
+            service: TokenBucket(rate, capacity)
+            for service, (rate, capacity) in (rate_limits or DEFAULT_RATE_LIMITS).items()
+        }
+        self.starvation_seconds = starvation_seconds
+        self.shed_level = shed_level
+        self.shed_below = shed_below
+        self.max_defer_seconds = max_defer_seconds
+        self.max_deferred = max_deferred
+
+        self._queues = [[] for _ in PRIORITIES]
+        self._running = [0] * len(PRIORITIES)
+        self._sequence = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._threads = []
+        self._latencies = {}
+        self.stats = {'scheduled': 0, 'completed': 0, 'deferred': 0, 'shed': 0, 'aged': 0}
+
+    def start(self):
+        """Start one worker thread per unit of the total concurrency budget"""
+        for number in range(sum(self.budgets)):
+            thread = threading.Thread(target=self._work, name=f"remediation-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def close(self, wait=True):
+        """Stop accepting work; with wait, return once every queued task has run or been shed"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def depth(self):
+        """Return the number of queued tasks"""
+        with self._condition:
+            return sum(len(queue) for queue in self._queues)
+
+    def submit(self, run, severity, category, on_shed=None, published_at=None):
+        """
+        Queue run() at the priority of severity and category; on_shed() is
+        called instead if the task is shed. published_at (epoch seconds)
+        is where its time to remediate starts.
+        """
+        level = finding_priority(severity, category)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Scheduler is closed")
+            self._sequence += 1
+            task = _Task(
+                level, (severity or 'LOW').upper(), remediation_service(category),
+                run, on_shed, published_at, self._sequence
+            )
+            self._queues[level].append(task)
+            self.stats['scheduled'] += 1
+            self._condition.notify()
+
+    def _deferred(self, task):
+        """Return True if task must wait for its service's bucket to refill"""
+        bucket = self.buckets.get(task.service)
+        return bucket is not None and task.level >= self.shed_level and bucket.fill() < self.shed_below
+
+    def _select(self):
+        """Pop the next runnable task, or return (None, seconds to wait); caller holds the lock"""
+        now = time.monotonic()
+        candidates = []
+        for level, queue in enumerate(self._queues):
+            if self._running[level] >= self.budgets[level]:
+                continue
+            candidates.extend(queue)
+        if not candidates:
+            return None, None
+
+        # Starving tasks first in arrival order, then by priority and arrival
+        candidates.sort(key=lambda task: (
+            now - task.queued_at < self.starvation_seconds,
+            task.level if now - task.queued_at < self.starvation_seconds else 0,
+            task.sequence
+        ))
+
+        wait = None
+        for task in candidates:
+            if self._deferred(task):
+                continue
+            bucket = self.buckets.get(task.service)
+            if bucket is not None and not bucket.try_acquire():
+                seconds = bucket.wait_seconds()
+                wait = seconds if wait is None else min(wait, seconds)
+                continue
+            if now - task.queued_at >= self.starvation_seconds and task.level > 0:
+                self.stats['aged'] += 1
+            self._queues[task.level].remove(task)
+            self._running[task.level] += 1
+            return task, None
+        return None, wait
+
+    def _shed(self):
+        """
+        Remove deferred tasks that waited too long, overflow max_deferred or are
+        left when the scheduler closes; caller holds the lock
+        """
+        now = time.monotonic()
+        deferred = [
+            task for queue in self._queues[self.shed_level:] for task in queue if self._deferred(task)
+        ]
+        deferred.sort(key=lambda task: task.sequence)
+        overflow = len(deferred) - self.max_deferred
+        shed = [
+            task for position, task in enumerate(deferred)
+            if self._closed or position < overflow or now - task.queued_at >= self.max_defer_seconds
+        ]
+        for task in shed:
+            self._queues[task.level].remove(task)
+        self.stats['deferred'] = len(deferred) - len(shed)
+        self.stats['shed'] += len(shed)
+        return shed
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while True:
+                    shed = self._shed()
+                    if shed:
+                        break
+                    task, wait = self._select()
+                    if task is not None:
+                        break
+                    if self._closed and not any(self._queues):
+                        return
+                    # Deferred tasks are re-checked as buckets refill
+                    self._condition.wait(wait if wait is not None else 1.0)
+
+            if shed:
+                for task in shed:
+                    logger.warning(f"Shed {task.severity} remediation for {task.service} while its quota is low")
+                    if task.on_shed is not None:
+                        try:
+                            task.on_shed()
+                        except Exception as e:
+                            logger.error(f"Failed to shed remediation: {str(e)}")
+                continue
+
+            try:
+                task.run()
+            except Exception as e:
+                logger.error(f"Scheduled remediation failed: {str(e)}")
+            finally:
+                with self._condition:
+                    self._running[task.level] -= 1
+                    self.stats['completed'] += 1
+                    if task.published_at is not None:
+                        self._latencies.setdefault(task.severity, []).append(time.time() - task.published_at)
+                    self._condition.notify_all()
+
+    def log_latencies(self):
+        """Log one time-to-remediate line per severity and reset the samples"""
+        with self._condition:
+            latencies, self._latencies = self._latencies, {}
+
+        for severity in sorted(latencies, key=lambda name: SEVERITY_PRIORITIES.get(name, len(PRIORITIES))):
+            samples = sorted(latencies[severity])
+            logger.info(json.dumps({
+                'event': 'time_to_remediate',
+                'severity': severity,
+                'count': len(samples),
+                'p50_ms': round(samples[len(samples) // 2] * 1000, 3),
+                'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+                'max_ms': round(samples[-1] * 1000, 3)
+            }))
+
+def budgets_from_env():
+    """Read FINDING_PRIORITY_BUDGETS as 'critical:8,high:4,medium:2,low:1'"""
+    budgets = dict(DEFAULT_BUDGETS)
+    value = os.environ.get('FINDING_PRIORITY_BUDGETS')
+    if value:
+        for entry in value.split(','):
+            priority, _, budget = entry.partition(':')
+            budgets[priority.strip().lower()] = int(budget)
+    return budgets
+
+def rate_limits_from_env():
+    """Read per-service limits from FINDING_RATE_<SERVICE> as 'rate' or 'rate:burst'"""
+    limits = {}
+    for service, (rate, capacity) in DEFAULT_RATE_LIMITS.items():
+        value = os.environ.get(f"FINDING_RATE_{service.upper()}")
+        if value:
+            rate_value, _, burst = value.partition(':')
+            rate = float(rate_value)
+            capacity = int(burst) if burst else max(1, int(rate * 2))
+        limits[service] = (rate, capacity)
+    return limits
+
+def scheduler_from_env():
+    return RemediationScheduler(
+        budgets=budgets_from_env(),
+        rate_limits=rate_limits_from_env(),
+        starvation_seconds=float(os.environ.get('FINDING_STARVATION_SECONDS', '60')),
+        shed_below=float(os.environ.get('FINDING_SHED_BELOW', '0.25')),
+        max_defer_seconds=float(os.environ.get('FINDING_MAX_DEFER_SECONDS', '300')),
+        max_deferred=int(os.environ.get('FINDING_MAX_DEFERRED', '500'))
+    )
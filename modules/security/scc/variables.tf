@@ -57,6 +57,24 @@ variable "auto_remediation_enabled" {
   default     = false
 }
 
+variable "finding_dedup_window_seconds" {
+  description = "Seconds a remediated resource and category absorbs repeat findings (0 disables deduplication)"
+  type        = number
+  default     = 3600
+}
+
+variable "finding_worker_enabled" {
+  description = "Remediate findings with the long-running micro-batch worker instead of one function invocation per finding"
+  type        = bool
+  default     = false
+}
+
+variable "finding_worker_target" {
+  description = "Where the finding worker is deployed (for example a Cloud Run service or VM name); required with finding_worker_enabled, since this module does not deploy the worker"
+  type        = string
+  default     = ""
+}
+
 variable "notification_config" {
   description = "Configuration for security notifications"
   type = object({
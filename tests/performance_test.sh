@@ -33,4 +33,8 @@ echo "Resource count: $resource_count"
 # Clean up
 rm -f perf-plan
 
+# Benchmark the policy enforcement path against its stored baseline
+echo "Testing policy enforcement performance..."
+python3 "$(dirname "$0")/policy_benchmark.py"
+
 echo "Performance tests completed"
\ No newline at end of file
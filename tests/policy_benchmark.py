@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+Policy Enforcement Benchmark
+Runs synthetic Terraform plans through the policy enforcer's Python path
+(plan ingestion, validate_plan, handle_violations and building violation rows)
+with Cloud Storage, BigQuery and Pub/Sub replaced by local fakes, and compares
+throughput, latency and peak RSS against a stored baseline
+
+The default stand-in evaluator only models data.terraform.security.deny; the
+other packages' queries are still planned and dispatched but return nothing,
+so standin validate timings cover the enforcer's overhead plus one package.
+Use --evaluator server to time the full rule set with OPA.
+"""
+
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+POLICY_DIR = os.path.join(TESTS_DIR, '..', 'modules', 'policy')
+sys.path.insert(0, os.path.join(POLICY_DIR, 'functions'))
+
+import policy_enforcer
+from policy_evaluator import create_evaluator, set_evaluator
+from clients import set_client
+from notification_publisher import NotificationPublisher, get_publisher, set_publisher
+
+BASELINE_PATH = os.path.join(TESTS_DIR, 'policy_benchmark_baseline.json')
+DEFAULT_SIZES = '100,1000,10000,100000'
+PLAN_BUCKET = 'benchmark-plans'
+
+# Share of each resource type in a generated plan, roughly what landing zone workspaces produce
+RESOURCE_TYPE_MIX = [
+    ('google_compute_instance', 22),
+    ('google_storage_bucket', 15),
+    ('google_project_iam_member', 15),
+    ('google_compute_disk', 10),
+    ('google_compute_firewall', 10),
+    ('google_sql_database_instance', 5),
+    ('google_cloudfunctions_function', 5),
+    ('google_project_service', 5),
+    ('google_container_cluster', 3),
+    ('google_service_account_key', 3),
+    ('google_compute_network', 3),
+    ('google_pubsub_topic', 4)
+]
+
+# Fakes for the Google Cloud clients used by the enforcer
+
+class FakeBlob:
+    def __init__(self, objects, name):
+        self.objects = objects
+        self.name = name
+
+    def open(self, mode='rb'):
+        return io.BytesIO(self.objects[self.name])
+
+class FakeBucket:
+    def __init__(self, objects):
+        self.objects = objects
+
+    def blob(self, name):
+        return FakeBlob(self.objects, name)
+
+class FakeStorageClient:
+    buckets = {}
+
+    def bucket(self, name):
+        return FakeBucket(self.buckets.setdefault(name, {}))
+
+class FakeDataset:
+    def __init__(self, dataset_id):
+        self.dataset_id = dataset_id
+
+    def table(self, table_id):
+        return f"{self.dataset_id}.{table_id}"
+
+class FakeTable:
+    def __init__(self, table_ref):
+        self.table_ref = table_ref
+        self.schema = []
+
+class FakeLoadJob:
+    def result(self, timeout=None):
+        return self
+
+class FakeBigQueryClient:
+    rows_inserted = 0
+    bytes_inserted = 0
+
+    def dataset(self, dataset_id):
+        return FakeDataset(dataset_id)
+
+    def get_table(self, table_ref):
+        return FakeTable(table_ref)
+
+    def insert_rows_json(self, table, rows, row_ids=None):
+        # Serialize like the real client so the payload cost is measured
+        FakeBigQueryClient.bytes_inserted += len(json.dumps(rows))
+        FakeBigQueryClient.rows_inserted += len(rows)
+        return []
+
+    def load_table_from_json(self, rows, table, job_config=None):
+        # Large writes go through a load job, which serializes the rows as newline-delimited JSON
+        FakeBigQueryClient.bytes_inserted += sum(len(json.dumps(row)) + 1 for row in rows)
+        FakeBigQueryClient.rows_inserted += len(rows)
+        return FakeLoadJob()
+
+class FakeFuture:
+    def __init__(self, message_id):
+        self.message_id = message_id
+
+    def result(self, timeout=None):
+        return self.message_id
+
+    def exception(self, timeout=None):
+        return None
+
+    def add_done_callback(self, callback):
+        callback(self)
+
+class FakePublisherClient:
+    messages_published = 0
+    bytes_published = 0
+
+    def topic_path(self, project_id, topic_name):
+        return f"projects/{project_id}/topics/{topic_name}"
+
+    def publish(self, topic_path, data, **attributes):
+        FakePublisherClient.messages_published += 1
+        FakePublisherClient.bytes_published += len(data)
+        return FakeFuture(str(FakePublisherClient.messages_published))
+
+def install_fakes():
+    """Point the enforcer's client modules at the local fakes"""
+    set_client('storage', FakeStorageClient())
+    set_client('bigquery', FakeBigQueryClient())
+    set_publisher(NotificationPublisher(project_id='benchmark-project', client_factory=FakePublisherClient))
+
+# Local stand-in for OPA, mirroring the rules in policies/security.rego
+
+def standin_violation(resource, rule, severity, msg):
+    return {
+        'address': resource.get('address'),
+        'type': resource.get('type'),
+        'rule_id': f"security.{rule}",
+        'severity': severity,
+        'msg': msg
+    }
+
+def security_deny(plan):
+    violations = []
+    for resource in plan.get('resource_changes') or []:
+        after = (resource.get('change') or {}).get('after') or {}
+        resource_type = resource.get('type')
+        address = resource.get('address')
+
+        if resource_type == 'google_compute_instance':
+            environment = (after.get('labels') or {}).get('environment')
+            if not environment:
+                violations.append(standin_violation(
+                    resource, 'instance_environment_label', 'medium',
+                    f"Compute instance {address} must have environment label"
+                ))
+            if environment == 'prod' and any(
+                interface.get('access_config') for interface in after.get('network_interface') or []
+            ):
+                violations.append(standin_violation(
+                    resource, 'instance_public_ip', 'high',
+                    f"Production instance {address} cannot have public IP"
+                ))
+        elif resource_type == 'google_storage_bucket':
+            if not after.get('encryption'):
+                violations.append(standin_violation(
+                    resource, 'bucket_encryption', 'high',
+                    f"Storage bucket {address} must have encryption enabled"
+                ))
+        elif resource_type == 'google_compute_firewall':
+            if '0.0.0.0/0' in (after.get('source_ranges') or []) and after.get('direction') == 'INGRESS':
+                violations.append(standin_violation(
+                    resource, 'firewall_open_ingress', 'high',
+                    f"Firewall rule {address} cannot allow traffic from 0.0.0.0/0"
+                ))
+        elif resource_type == 'google_sql_database_instance':
+            settings = (after.get('settings') or [{}])[0]
+            backup = (settings.get('backup_configuration') or [{}])[0]
+            if not backup.get('enabled'):
+                violations.append(standin_violation(
+                    resource, 'sql_backup', 'medium',
+                    f"Cloud SQL instance {address} must have backup enabled"
+                ))
+    return sorted(violations, key=lambda violation: violation['msg'])
+
+STANDIN_RULES = {
+    'data.terraform.security.deny': security_deny
+}
+
+class StandInEvaluator:
+    """
+    Evaluates the security package in Python so the benchmark measures the
+    enforcer's own overhead without an OPA binary; every other package's
+    query returns no violations
+    """
+
+    name = 'standin'
+
+    def evaluate(self, policy_path, input_data, query='data.terraform'):
+        # Round-trip the input as the server backend would serialize it
+        input_data = json.loads(json.dumps(input_data))
+        rule = STANDIN_RULES.get(query)
+        return rule(input_data) if rule else []
+
+    def close(self):
+        """Nothing to release"""
+
+# Synthetic plans
+
+def synthetic_after(resource_type, violating, rng):
+    """Return change.after for a resource, non-compliant when violating is True"""
+    environment = rng.choice(['prod', 'staging', 'dev'])
+    labels = {'environment': environment, 'team': f"team-{rng.randint(1, 20)}", 'cost_center': 'cc-100'}
+
+    if resource_type == 'google_compute_instance':
+        if violating:
+            if rng.random() < 0.5:
+                labels.pop('environment')
+            else:
+                labels['environment'] = 'prod'
+        interface = {'network': 'shared-vpc', 'subnetwork': 'subnet-a'}
+        if violating and labels.get('environment') == 'prod':
+            interface['access_config'] = [{'nat_ip': None}]
+        return {
+            'machine_type': rng.choice(['e2-standard-2', 'n2-standard-4']),
+            'zone': 'europe-west1-b',
+            'labels': labels,
+            'network_interface': [interface],
+            'shielded_instance_config': [{'enable_secure_boot': not violating}],
+            'metadata': {'enable-oslogin': 'TRUE'}
+        }
+    if resource_type == 'google_storage_bucket':
+        after = {
+            'location': 'EU',
+            'labels': labels,
+            'uniform_bucket_level_access': True,
+            'versioning': [{'enabled': True}]
+        }
+        if not violating:
+            after['encryption'] = [{'default_kms_key_name': 'projects/p/locations/eu/keyRings/r/cryptoKeys/k'}]
+        return after
+    if resource_type == 'google_compute_firewall':
+        return {
+            'network': 'shared-vpc',
+            'direction': 'INGRESS',
+            'source_ranges': ['0.0.0.0/0'] if violating else ['10.0.0.0/8'],
+            'allow': [{'protocol': 'tcp', 'ports': ['443']}]
+        }
+    if resource_type == 'google_sql_database_instance':
+        return {
+            'database_version': 'POSTGRES_14',
+            'region': 'europe-west1',
+            'settings': [{
+                'tier': 'db-custom-2-7680',
+                'user_labels': labels,
+                'backup_configuration': [{'enabled': not violating}],
+                'ip_configuration': [{'ipv4_enabled': violating, 'require_ssl': True}]
+            }]
+        }
+    if resource_type == 'google_project_iam_member':
+        return {
+            'project': 'benchmark-project',
+            'role': 'roles/owner' if violating else 'roles/viewer',
+            'member': 'user:someone@example.com' if violating else 'group:platform@example.com'
+        }
+    return {'name': f"resource-{rng.randint(0, 1 << 20)}", 'labels': labels if not violating else {}}
+
+def generate_plan(size, violation_rate=0.2, seed=0):
+    """Return a Terraform plan JSON document with size resource changes"""
+    rng = random.Random(seed + size)
+    types = [resource_type for resource_type, _ in RESOURCE_TYPE_MIX]
+    weights = [weight for _, weight in RESOURCE_TYPE_MIX]
+
+    resource_changes = []
+    for number, resource_type in enumerate(rng.choices(types, weights, k=size)):
+        name = f"r{number}"
+        after = synthetic_after(resource_type, rng.random() < violation_rate, rng)
+        resource_changes.append({
+            'address': f"module.workload_{number // 50}.{resource_type}.{name}",
+            'module_address': f"module.workload_{number // 50}",
+            'mode': 'managed',
+            'type': resource_type,
+            'name': name,
+            'provider_name': 'registry.terraform.io/hashicorp/google',
+            'change': {
+                'actions': ['create'],
+                'before': None,
+                'after': after,
+                'after_unknown': {'id': True, 'self_link': True},
+                'before_sensitive': False,
+                'after_sensitive': {}
+            }
+        })
+
+    return {
+        'format_version': '1.2',
+        'terraform_version': '1.5.7',
+        'planned_values': {'root_module': {'resources': [{'address': change['address']} for change in resource_changes]}},
+        'resource_changes': resource_changes,
+        'configuration': {'provider_config': {'google': {'name': 'google'}}}
+    }
+
+# Measurement
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def summarize(samples, items):
+    median = percentile(samples, 0.50)
+    return {
+        'iterations': len(samples),
+        'items': items,
+        # Based on the median run so a single slow run does not move the baseline comparison
+        'throughput': items / median if median else 0.0,
+        'p50_ms': median * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000
+    }
+
+def timed(function, iterations):
+    samples = []
+    result = None
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - start)
+    return samples, result
+
+def default_iterations(size):
+    return min(200, max(3, 100000 // size))
+
+def benchmark_size(size, policy_path, iterations, violation_rate):
+    """Benchmark every stage for one plan size and return its results"""
+    policy_enforcer.reset_peak_memory()
+
+    plan_uri = f"gs://{PLAN_BUCKET}/plans/{size}.json"
+    FakeStorageClient.buckets.setdefault(PLAN_BUCKET, {})[f"plans/{size}.json"] = json.dumps(
+        generate_plan(size, violation_rate)
+    ).encode('utf-8')
+    message_data = {'workspace': f"benchmark-{size}", 'environment': 'benchmark', 'timestamp': '2024-01-01T00:00:00Z'}
+
+    # Warm the policy index and evaluator outside the timed runs
+    resource_changes = policy_enforcer.load_plan_from_uri(plan_uri)
+    terraform_plan = {'resource_changes': resource_changes}
+    violations = policy_enforcer.validate_plan(terraform_plan, policy_path)
+
+    def handle():
+        policy_enforcer.handle_violations(violations, message_data)
+        get_publisher().flush()
+
+    def build_rows():
+        policy_enforcer.build_violation_rows(violations, message_data)
+
+    stages = {}
+    samples, _ = timed(lambda: policy_enforcer.load_plan_from_uri(plan_uri), iterations)
+    stages['ingest'] = summarize(samples, size)
+    samples, _ = timed(lambda: policy_enforcer.validate_plan(terraform_plan, policy_path), iterations)
+    stages['validate'] = summarize(samples, size)
+    samples, _ = timed(handle, iterations)
+    stages['handle_violations'] = summarize(samples, len(violations))
+    samples, _ = timed(build_rows, iterations)
+    stages['build_rows'] = summarize(samples, len(violations))
+
+    return {
+        'resource_changes': size,
+        'violations': len(violations),
+        'peak_rss_mb': policy_enforcer.peak_memory_mb(),
+        'stages': stages
+    }
+
+def compare(results, baseline, tolerance, min_delta_ms=1.0):
+    """
+    Return a list of regressions of results against baseline
+
+    Stages that slowed down by less than min_delta_ms are not compared, so
+    timer jitter on sub-millisecond stages does not fail the run.
+    """
+    regressions = []
+    for size, result in results.items():
+        expected = baseline.get(size)
+        if expected is None:
+            regressions.append(f"{size}: no baseline for this plan size, run with --update-baseline to record one")
+            continue
+
+        if result['peak_rss_mb'] > expected['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(
+                f"{size}: peak RSS {result['peak_rss_mb']:.1f} MB > baseline {expected['peak_rss_mb']:.1f} MB"
+            )
+
+        for stage, stats in result['stages'].items():
+            expected_stats = expected['stages'].get(stage)
+            if expected_stats is None:
+                continue
+            if (stats['p50_ms'] - expected_stats['p50_ms'] < min_delta_ms
+                    and stats['p99_ms'] - expected_stats['p99_ms'] < min_delta_ms):
+                continue
+            if stats['throughput'] < expected_stats['throughput'] * (1 - tolerance):
+                regressions.append(
+                    f"{size} {stage}: throughput {stats['throughput']:.0f}/s < baseline {expected_stats['throughput']:.0f}/s"
+                )
+            if stats['p99_ms'] > expected_stats['p99_ms'] * (1 + tolerance):
+                regressions.append(
+                    f"{size} {stage}: p99 {stats['p99_ms']:.2f} ms > baseline {expected_stats['p99_ms']:.2f} ms"
+                )
+    return regressions
+
+def print_results(results):
+    print(f"{'changes':>8} {'stage':<18} {'items':>7} {'throughput/s':>13} {'p50 ms':>10} {'p99 ms':>10} {'peak MB':>8}")
+    for size, result in results.items():
+        for stage, stats in result['stages'].items():
+            print(
+                f"{size:>8} {stage:<18} {stats['items']:>7} {stats['throughput']:>13.0f} "
+                f"{stats['p50_ms']:>10.2f} {stats['p99_ms']:>10.2f} {result['peak_rss_mb']:>8.1f}"
+            )
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sizes', default=os.environ.get('POLICY_BENCHMARK_SIZES', DEFAULT_SIZES),
+                        help='comma-separated plan sizes in resource changes')
+    parser.add_argument('--iterations', type=int, default=0,
+                        help='timed runs per stage (default scales with plan size)')
+    parser.add_argument('--violation-rate', type=float, default=0.2)
+    parser.add_argument('--evaluator', default=os.environ.get('POLICY_BENCHMARK_EVALUATOR', 'standin'),
+                        choices=['standin', 'server', 'subprocess'])
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float,
+                        default=float(os.environ.get('POLICY_BENCHMARK_TOLERANCE', '0.25')),
+                        help='allowed relative regression before failing')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help='ignore stage slowdowns smaller than this many milliseconds')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='record these results as the baseline instead of comparing')
+    parser.add_argument('--output', help='also write results as JSON to this path')
+    args = parser.parse_args()
+
+    # The enforcer logs every evaluation at INFO; keep the report readable
+    logging.getLogger().setLevel(logging.ERROR)
+
+    install_fakes()
+    evaluator = StandInEvaluator() if args.evaluator == 'standin' else create_evaluator(args.evaluator)
+    set_evaluator(evaluator)
+    policy_path = os.path.abspath(os.path.join(POLICY_DIR, 'policies'))
+
+    print(f"Running policy enforcement benchmark with {evaluator.name} evaluator...")
+    if args.evaluator == 'standin':
+        print("NOTE: The stand-in evaluator models only data.terraform.security.deny; "
+              "validate timings exclude the other policy packages")
+    results = {}
+    try:
+        for size in [int(value) for value in args.sizes.split(',') if value.strip()]:
+            iterations = args.iterations or default_iterations(size)
+            results[str(size)] = benchmark_size(size, policy_path, iterations, args.violation_rate)
+    finally:
+        set_evaluator(None)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    baselines = load_baseline(args.baseline)
+    if args.update_baseline:
+        baselines[args.evaluator] = results
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline for {args.evaluator} evaluator written to {args.baseline}")
+        return True
+
+    if args.evaluator not in baselines:
+        print(f"FAIL: No stored baseline for {args.evaluator} evaluator in {args.baseline}, "
+              f"run with --update-baseline to record one")
+        return False
+
+    regressions = compare(results, baselines[args.evaluator], args.tolerance, args.min_delta_ms)
+    if regressions:
+        print(f"FAIL: {len(regressions)} benchmark regressions beyond {args.tolerance:.0%} of baseline")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return False
+
+    print("PASS: Policy enforcement benchmark within baseline")
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
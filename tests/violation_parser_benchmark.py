@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Violation Parser Benchmark
+Compares violation_parser.parse_violation with the substring and regex
+helpers it replaced on a batch of policy violation messages, and fails if
+they give different answers or parse_violation is less than --min-speedup
+times faster. Building enforcer rows parses each message once and is timed
+without the parser's cache. Auto-remediation is not timed separately: it
+now parses each message once, in normalize_violation, and classifies from
+the cached result, so its parsing cost is the enforcer row's. Timings are
+the median of repeated runs.
+"""
+
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'modules', 'policy', 'functions'))
+
+from violation_parser import parse_violation
+
+# Message formats produced by the policies in modules/policy/policies
+MESSAGE_FORMATS = [
+    "Compute instance {address} must have environment label",
+    "Storage bucket {address} must have encryption enabled",
+    "Production instance {address} cannot have public IP",
+    "Firewall rule {address} cannot allow traffic from 0.0.0.0/0",
+    "Cloud SQL instance {address} must have backup enabled",
+    "Cloud SQL instance {address} should not have public IP",
+    "Resource {address} must have security_classification label",
+    "Storage bucket {address} must use customer-managed encryption keys",
+    "GKE cluster {address} must have network policy enabled",
+    "Compute instance {address} must have Shielded VM enabled",
+    "Service account {address} should not have broad permissions",
+    "Billable resource {address} must have cost_center label",
+    "Instance {address} should not use default service account",
+    "Project {address} must have audit logging enabled for critical services"
+]
+
+RESOURCE_TYPES = [
+    'google_compute_instance', 'google_storage_bucket', 'google_sql_database_instance',
+    'google_compute_firewall', 'google_container_cluster', 'google_service_account'
+]
+
+# The helpers parse_violation replaced, kept here as the comparison baseline.
+# Their per-call 'import re' is hoisted to the module so it does not inflate the
+# legacy timings; re.search still compiles through re's own pattern cache.
+
+def legacy_classify_violation(violation):
+    violation_lower = violation.lower()
+    if 'label' in violation_lower:
+        return 'missing_labels'
+    elif 'public ip' in violation_lower and 'production' in violation_lower:
+        return 'public_ip'
+    elif 'encryption' in violation_lower and 'bucket' in violation_lower:
+        return 'unencrypted_storage'
+    elif 'firewall' in violation_lower and '0.0.0.0/0' in violation_lower:
+        return 'open_firewall'
+    elif 'sql' in violation_lower and 'public ip' in violation_lower:
+        return 'sql_public_ip'
+    elif 'backup' in violation_lower:
+        return 'missing_backup'
+    else:
+        return 'unknown'
+
+def legacy_extract_resource_info(violation):
+    resource_match = re.search(r'(google_\w+)\.(\w+)', violation)
+    if resource_match:
+        return {'type': resource_match.group(1), 'name': resource_match.group(2)}
+    return {'type': 'unknown', 'name': 'unknown'}
+
+def legacy_extract_resource_name(violation):
+    match = re.search(r'(\w+\.\w+)', violation)
+    return match.group(1) if match else 'unknown'
+
+def legacy_determine_severity(violation):
+    high_severity_keywords = ['public', 'encryption', 'firewall', 'admin']
+    medium_severity_keywords = ['label', 'backup', 'logging']
+    violation_lower = violation.lower()
+    if any(keyword in violation_lower for keyword in high_severity_keywords):
+        return 'high'
+    elif any(keyword in violation_lower for keyword in medium_severity_keywords):
+        return 'medium'
+    else:
+        return 'low'
+
+def legacy_parse(violation):
+    """Everything the enforcer and auto-remediation used to compute per message"""
+    resource_info = legacy_extract_resource_info(violation)
+    return {
+        'violation_type': legacy_classify_violation(violation),
+        'severity': legacy_determine_severity(violation),
+        'resource_type': resource_info['type'],
+        'resource_name': resource_info['name'],
+        'dotted_name': legacy_extract_resource_name(violation)
+    }
+
+def generate_messages(count, seed=0):
+    """Return count violation messages with module, root and indexed addresses"""
+    rng = random.Random(seed)
+    messages = []
+    for number in range(count):
+        address = f"{rng.choice(RESOURCE_TYPES)}.r{number}"
+        prefix = rng.random()
+        if prefix < 0.5:
+            address = f"module.workload_{number // 50}.{address}"
+        elif prefix < 0.6:
+            address = f"{address}[{rng.randint(0, 3)}]"
+        messages.append(rng.choice(MESSAGE_FORMATS).format(address=address))
+    return messages
+
+def median_of(function, messages, repeats):
+    """Return the median of repeats runs of function over every message"""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(messages)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+# The parser without its cache, to separate the matcher from the caching
+uncached_parse = parse_violation.__wrapped__
+
+def legacy_rows(messages):
+    for message in messages:
+        legacy_parse(message)
+
+def parser_rows(messages):
+    # Each batch is parsed once in the enforcer, so measure without the cache
+    for message in messages:
+        uncached_parse(message)
+
+WORKLOADS = [
+    ('enforcer rows', legacy_rows, parser_rows)
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--repeats', type=int, default=15)
+    parser.add_argument('--min-speedup', type=float, default=1.05,
+                        help='fail if any workload is not this many times faster')
+    args = parser.parse_args()
+
+    messages = generate_messages(args.messages)
+
+    mismatches = [message for message in messages if parse_violation(message) != legacy_parse(message)]
+
+    print(f"Parsing {len(messages)} violation messages (median of {args.repeats})")
+    print(f"{'workload':<18} {'legacy ms':>10} {'parser ms':>10} {'speedup':>8}")
+    slower = []
+    for name, legacy, parsed in WORKLOADS:
+        legacy_seconds = median_of(legacy, messages, args.repeats)
+        parser_seconds = median_of(parsed, messages, args.repeats)
+        speedup = legacy_seconds / parser_seconds if parser_seconds else float('inf')
+        print(f"{name:<18} {legacy_seconds * 1000:>10.2f} {parser_seconds * 1000:>10.2f} {speedup:>7.2f}x")
+        if args.min_speedup and speedup < args.min_speedup:
+            slower.append(name)
+
+    if mismatches:
+        print(f"FAIL: {len(mismatches)} messages parsed differently, e.g. {mismatches[0]!r}")
+        return False
+    if slower:
+        print(f"FAIL: parse_violation is less than {args.min_speedup:.2f}x faster for {', '.join(slower)}")
+        return False
+
+    print(f"PASS: parse_violation agrees with the legacy helpers and is at least {args.min_speedup:.2f}x faster")
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)